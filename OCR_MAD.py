@@ -9,6 +9,18 @@ import traceback
 import logging
 import tempfile
 import subprocess
+import argparse
+import re
+import shutil
+import sqlite3
+import time
+import hashlib
+import zipfile
+import ctypes
+import json
+import contextlib
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # === CONFIGURACIÓN DE LOGGING MEJORADA ===
 def setup_logging():
@@ -55,7 +67,7 @@ except ImportError as e:
     sys.exit(1)
 
 try:
-    from PIL import Image, ImageEnhance, ImageFilter
+    from PIL import Image, ImageFilter
     logging.info("PIL importado correctamente")
 except ImportError as e:
     logging.error(f"Error importando PIL: {e}")
@@ -88,8 +100,353 @@ def get_base_dir():
 BASE_DIR = get_base_dir()
 logging.info(f"BASE_DIR detectado: {BASE_DIR}")
 
+# === PERFILES DE OCR ===
+# Cada perfil agrupa idiomas, motor, segmentación, DPI y preprocesamiento.
+# "tessdata" es el nombre de la carpeta de modelos (hermana de tessdata/);
+# si no existe o le faltan idiomas se usa la tessdata normal.
+# "detect_language" muestrea el documento y deja solo los idiomas que aparecen.
+OCR_PROFILES = {
+    "fast": {
+        "description": "Rápido (un idioma, modelos fast, 200 DPI)",
+        "langs": "spa",
+        "oem": 1,
+        "psm": 3,
+        "dpi": 200,
+        "preprocess": False,
+        "tessdata": "tessdata_fast",
+        "detect_language": False,
+    },
+    "balanced": {
+        "description": "Normal (español + inglés, 300 DPI)",
+        "langs": "spa+eng",
+        "oem": 1,
+        "psm": 3,
+        "dpi": 300,
+        "preprocess": True,
+        "tessdata": "tessdata",
+        "detect_language": True,
+    },
+    "accurate": {
+        "description": "Preciso (español + inglés, modelos best, 400 DPI)",
+        "langs": "spa+eng",
+        "oem": 1,
+        "psm": 3,
+        "dpi": 400,
+        "preprocess": True,
+        "tessdata": "tessdata_best",
+        "detect_language": True,
+    },
+}
+DEFAULT_PROFILE = "balanced"
+
+# Claves que se pueden cambiar en una variante ("balanced:dpi=200") y su tipo
+PROFILE_VARIANT_KEYS = {
+    "langs": str,
+    "oem": int,
+    "psm": int,
+    "dpi": int,
+    "preprocess": bool,
+    "tessdata": str,
+    "detect_language": bool,
+}
+PROFILE_TRUE_VALUES = ("1", "true", "si", "sí", "yes")
+PROFILE_FALSE_VALUES = ("0", "false", "no")
+
+def get_profile(profile_name=None):
+    """Devuelve el perfil de OCR pedido (o el perfil por defecto)
+
+    También acepta variantes de un perfil con algunas claves cambiadas,
+    como "balanced:dpi=200" o "accurate:preprocess=no:psm=6".
+    """
+    name = profile_name or DEFAULT_PROFILE
+    if name in OCR_PROFILES:
+        return OCR_PROFILES[name]
+    if ":" in name:
+        return profile_variant(name)
+    raise ValueError(f"Perfil de OCR desconocido: {name}. Disponibles: {', '.join(OCR_PROFILES)}")
+
+def profile_variant(name):
+    """Arma un perfil derivado de "base:clave=valor[:clave=valor...]" """
+    base, *overrides = name.split(":")
+    if base not in OCR_PROFILES:
+        raise ValueError(f"Perfil de OCR desconocido: {base}. Disponibles: {', '.join(OCR_PROFILES)}")
+    profile = dict(OCR_PROFILES[base])
+    for override in overrides:
+        key, _, value = (part.strip() for part in override.partition("="))
+        kind = PROFILE_VARIANT_KEYS.get(key)
+        if kind is None or not value:
+            raise ValueError(
+                f"Variante de perfil inválida: {override}. Usá clave=valor con: {', '.join(PROFILE_VARIANT_KEYS)}"
+            )
+        if kind is bool:
+            if value.lower() not in PROFILE_TRUE_VALUES + PROFILE_FALSE_VALUES:
+                raise ValueError(f"Valor inválido para {key}: {value} (usá sí/no)")
+            profile[key] = value.lower() in PROFILE_TRUE_VALUES
+        elif kind is int:
+            try:
+                profile[key] = int(value)
+            except ValueError:
+                raise ValueError(f"Valor inválido para {key}: {value} (tiene que ser un número)")
+        else:
+            profile[key] = value
+    profile["description"] = f"{OCR_PROFILES[base]['description']} con {', '.join(overrides)}"
+    return profile
+
+def profile_lang_files(profile):
+    """Lista los .traineddata que necesita un perfil"""
+    return [f"{lang}.traineddata" for lang in profile["langs"].split("+") if lang]
+
+def resolve_tessdata_dir(profile, base_tessdata=None):
+    """Busca la carpeta de modelos del perfil, con la tessdata normal como respaldo"""
+    base_tessdata = base_tessdata or os.environ.get("TESSDATA_PREFIX", "")
+    if not base_tessdata:
+        return ""
+    candidate = os.path.join(os.path.dirname(os.path.normpath(base_tessdata)), profile["tessdata"])
+    if os.path.isdir(candidate) and all(
+        os.path.exists(os.path.join(candidate, f)) for f in profile_lang_files(profile)
+    ):
+        return candidate
+    if os.path.normpath(candidate) != os.path.normpath(base_tessdata):
+        logging.warning(f"No se encontró {candidate} con los idiomas del perfil, usando {base_tessdata}")
+    return base_tessdata
+
+def build_tesseract_cmd(input_path, output_base, profile, tessdata_dir="", simple=False, create_pdf=True):
+    """Arma el comando de Tesseract que genera un PDF con texto para un perfil
+
+    Con create_pdf=False y output_base="stdout" Tesseract devuelve solo el texto.
+    """
+    cmd = [
+        pytesseract.pytesseract.tesseract_cmd,
+        input_path,
+        output_base,  # Base name sin extensión
+        '-l', profile["langs"],
+        '--oem', str(profile["oem"]),
+        '--psm', str(profile["psm"]),
+    ]
+    if profile.get("dpi"):
+        cmd.extend(['--dpi', str(profile["dpi"])])
+    if not simple:
+        cmd.extend(['-c', 'preserve_interword_spaces=1'])
+    if create_pdf:
+        cmd.extend(['-c', 'tessedit_create_pdf=1'])  # ¡¡¡ESTA ES LA FORMA CORRECTA DE GENERAR PDF!!!
+    if tessdata_dir:
+        cmd.extend(['--tessdata-dir', tessdata_dir])
+    return cmd
+
+_PRELOADED_PROFILES = set()
+
+def preload_profile(profile_name=None):
+    """Precarga los modelos de un perfil leyéndolos una vez (quedan en la caché del sistema)
+
+    Tesseract se ejecuta como proceso aparte por página, así que no hay un
+    worker residente: lo que sí se puede adelantar es la lectura de los
+    .traineddata del disco para que la primera página no pague ese costo.
+    """
+    profile = get_profile(profile_name)
+    name = profile_name or DEFAULT_PROFILE
+    if name in _PRELOADED_PROFILES:
+        return True
+    tessdata_dir = resolve_tessdata_dir(profile)
+    if not tessdata_dir:
+        logging.warning(f"No se puede precargar el perfil {name}: TESSDATA_PREFIX no configurado")
+        return False
+    for lang_file in profile_lang_files(profile):
+        lang_path = os.path.join(tessdata_dir, lang_file)
+        try:
+            with open(lang_path, 'rb') as f:
+                while f.read(1024 * 1024):
+                    pass
+        except OSError as e:
+            logging.error(f"No se pudo precargar {lang_path}: {e}")
+            return False
+    _PRELOADED_PROFILES.add(name)
+    logging.info(f"Perfil {name} precargado ({profile['langs']} desde {tessdata_dir})")
+    return True
+
+# === GOBERNADOR DE RECURSOS ===
+# Para no ahogar un equipo compartido: cuántos Tesseract corren a la vez,
+# cuántos hilos OpenMP usa cada uno, cuánta memoria libre se le deja al
+# resto, cuánto disco temporal se puede ocupar y con qué prioridad corre.
+# Si el equipo está cargado o con poca memoria, se arrancan menos páginas.
+GOVERNOR_DEFAULTS = {
+    "max_workers": max(1, (os.cpu_count() or 1) - 1),
+    "omp_threads": 1,             # Tesseract ya corre en paralelo por página: sin OpenMP extra
+    "memory_reserve_mb": 1024,    # No arrancar otra página si queda menos memoria libre
+    "temp_quota_mb": 2048,        # Máximo de archivos temporales propios a la vez
+    "low_priority": True,         # Prioridad baja de CPU (y de disco donde se pueda)
+}
+GOVERNOR_POLL_SECONDS = 0.5
+
+def available_memory_mb():
+    """Memoria física libre del equipo en MB (None si no se puede medir)"""
+    try:
+        if platform.system() == "Windows":
+            class MEMORYSTATUSEX(ctypes.Structure):
+                _fields_ = [
+                    ("dwLength", ctypes.c_ulong),
+                    ("dwMemoryLoad", ctypes.c_ulong),
+                    ("ullTotalPhys", ctypes.c_ulonglong),
+                    ("ullAvailPhys", ctypes.c_ulonglong),
+                    ("ullTotalPageFile", ctypes.c_ulonglong),
+                    ("ullAvailPageFile", ctypes.c_ulonglong),
+                    ("ullTotalVirtual", ctypes.c_ulonglong),
+                    ("ullAvailVirtual", ctypes.c_ulonglong),
+                    ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+                ]
+            status = MEMORYSTATUSEX()
+            status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+            if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+                return status.ullAvailPhys / 1024 / 1024
+            return None
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except Exception as e:
+        logging.debug(f"No se pudo medir la memoria libre: {e}")
+    return None
+
+class ResourceGovernor:
+    """Reparte turnos para correr Tesseract respetando los límites configurados"""
+    
+    def __init__(self, **settings):
+        self.settings = dict(GOVERNOR_DEFAULTS)
+        self.condition = threading.Condition()
+        self.active = 0
+        self.temp_dirs = set()
+        self._cpu_sample = None
+        self.configure(**settings)
+    
+    def configure(self, **settings):
+        """Cambia los límites (los valores None se ignoran)"""
+        unknown = set(settings) - set(GOVERNOR_DEFAULTS)
+        if unknown:
+            raise ValueError(f"Límites desconocidos: {', '.join(sorted(unknown))}")
+        with self.condition:
+            self.settings.update({k: v for k, v in settings.items() if v is not None})
+            self.condition.notify_all()
+        logging.info(f"Gobernador de recursos: {self.settings}")
+    
+    def busy_cores(self):
+        """Núcleos ocupados en el equipo (todo el sistema, incluidos nuestros Tesseract)"""
+        try:
+            if hasattr(os, "getloadavg"):
+                return os.getloadavg()[0]
+            if platform.system() == "Windows":
+                idle, kernel, user = (ctypes.c_ulonglong(), ctypes.c_ulonglong(), ctypes.c_ulonglong())
+                if not ctypes.windll.kernel32.GetSystemTimes(
+                    ctypes.byref(idle), ctypes.byref(kernel), ctypes.byref(user)
+                ):
+                    return None
+                now = (time.monotonic(), idle.value, kernel.value + user.value)
+                previous, self._cpu_sample = self._cpu_sample, now
+                # Hace falta un intervalo razonable entre muestras para que el dato sirva
+                if previous is None or now[0] - previous[0] < 1:
+                    if previous is not None:
+                        self._cpu_sample = previous
+                    return None
+                total = now[2] - previous[2]
+                if total <= 0:
+                    return None
+                return (1 - (now[1] - previous[1]) / total) * (os.cpu_count() or 1)
+        except Exception as e:
+            logging.debug(f"No se pudo medir la carga de CPU: {e}")
+        return None
+    
+    def temp_usage_mb(self):
+        """Espacio que ocupan ahora los archivos temporales propios"""
+        total = 0
+        for temp_dir in list(self.temp_dirs):
+            try:
+                for entry in os.scandir(temp_dir):
+                    if entry.is_file():
+                        total += entry.stat().st_size
+            except OSError:
+                continue
+        return total / 1024 / 1024
+    
+    def allowed_workers(self):
+        """Cuántos Tesseract pueden correr ahora según carga, memoria y disco"""
+        limit = self.settings["max_workers"]
+        omp_threads = self.settings["omp_threads"]
+        
+        # Dejar lugar a lo que ya está usando CPU fuera de OCR-MAD
+        busy = self.busy_cores()
+        if busy is not None:
+            external = max(0.0, busy - self.active * omp_threads)
+            free_cores = (os.cpu_count() or 1) - external
+            limit = min(limit, max(1, int(free_cores // omp_threads)))
+        
+        # Con poca memoria o con el cupo de disco lleno no se arranca nada nuevo
+        free_mb = available_memory_mb()
+        if free_mb is not None and free_mb < self.settings["memory_reserve_mb"]:
+            limit = min(limit, self.active)
+        if self.temp_usage_mb() >= self.settings["temp_quota_mb"]:
+            limit = min(limit, self.active)
+        
+        # Siempre se deja correr al menos una página para no trabarse
+        return max(1, limit)
+    
+    def acquire(self):
+        """Espera un turno para correr Tesseract"""
+        with self.condition:
+            while self.active >= self.allowed_workers():
+                self.condition.wait(GOVERNOR_POLL_SECONDS)
+            self.active += 1
+    
+    def has_capacity(self):
+        """True si ahora mismo habría un turno libre (sin reservarlo)"""
+        with self.condition:
+            return self.active < self.allowed_workers()
+    
+    def release(self):
+        """Devuelve el turno"""
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+    
+    def track_temp_dir(self, temp_dir):
+        self.temp_dirs.add(temp_dir)
+    
+    def untrack_temp_dir(self, temp_dir):
+        self.temp_dirs.discard(temp_dir)
+    
+    @contextlib.contextmanager
+    def temp_dir(self, prefix="ocr_mad_"):
+        """Carpeta temporal que cuenta para temp_quota_mb y se borra al salir (aunque haya error)"""
+        temp_dir = tempfile.mkdtemp(prefix=prefix)
+        self.track_temp_dir(temp_dir)
+        try:
+            yield temp_dir
+        finally:
+            self.untrack_temp_dir(temp_dir)
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    def run_tesseract(self, cmd, **kwargs):
+        """Ejecuta Tesseract con el límite de hilos OpenMP y la prioridad configurados"""
+        env = dict(os.environ, OMP_THREAD_LIMIT=str(self.settings["omp_threads"]))
+        if self.settings["low_priority"]:
+            if platform.system() == "Windows":
+                kwargs["creationflags"] = kwargs.get("creationflags", 0) | subprocess.BELOW_NORMAL_PRIORITY_CLASS
+            else:
+                prefix = ["nice", "-n", "10"] if shutil.which("nice") else []
+                if shutil.which("ionice"):
+                    prefix = ["ionice", "-c", "3"] + prefix
+                cmd = prefix + list(cmd)
+        return subprocess.run(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            check=False,
+            env=env,
+            **kwargs
+        )
+
+GOVERNOR = ResourceGovernor()
+
 # === CONFIGURACIÓN DE TESSERACT PORTABLE MEJORADA ===
-def setup_tesseract():
+def setup_tesseract(profile_name=None):
     """Configura Tesseract OCR para funcionar correctamente en modo portátil y --onefile"""
     try:
         # Determinar la ruta base correcta
@@ -160,11 +517,13 @@ def setup_tesseract():
             logging.error(error_msg)
             return False, None, error_msg
         
-        # Verificar archivos de idioma esenciales
-        required_files = ["spa.traineddata", "eng.traineddata"]
+        # Verificar archivos de idioma que necesita el perfil
+        profile = get_profile(profile_name)
+        profile_tessdata = resolve_tessdata_dir(profile, tessdata_dir)
+        required_files = profile_lang_files(profile)
         missing_files = []
         for lang_file in required_files:
-            lang_path = os.path.join(tessdata_dir, lang_file)
+            lang_path = os.path.join(profile_tessdata, lang_file)
             if not os.path.exists(lang_path):
                 missing_files.append(lang_file)
         
@@ -203,10 +562,13 @@ def preprocess_image(img: Image.Image) -> Image.Image:
     try:
         logging.debug("Iniciando preprocesamiento de imagen")
         # Convertir a escala de grises
-        img = img.convert("L")
-        # Aumentar contraste
-        enhancer = ImageEnhance.Contrast(img)
-        img = enhancer.enhance(2.0)
+        if img.mode != "L":
+            img = img.convert("L")
+        # Aumentar contraste (x2 alrededor del gris medio, como ImageEnhance.Contrast,
+        # pero con una tabla: sin imagen gris auxiliar ni mezcla de dos copias)
+        histogram = img.histogram()
+        mean = int(sum(i * count for i, count in enumerate(histogram)) / sum(histogram) + 0.5)
+        img = img.point([min(255, max(0, 2 * x - mean)) for x in range(256)])
         # Aumentar nitidez
         img = img.filter(ImageFilter.SHARPEN)
         # Umbral adaptativo
@@ -258,222 +620,959 @@ def preprocess_image(img: Image.Image) -> Image.Image:
         raise
 
 
-# === OCR PARA PDF - CORREGIDO DEFINITIVO ===
-def ocr_pdf(input_pdf: str, output_pdf: str, progress_callback=None):
-    """Realiza OCR en un archivo PDF y genera un PDF con texto seleccionable"""
-    try:
-        logging.info(f"Iniciando OCR para PDF: {input_pdf}")
-        logging.info(f"Archivo de salida: {output_pdf}")
+# === ENTRADA Y RENDERIZADO DE PÁGINAS ===
+# Los PDFs se abren por ruta: MuPDF lee del disco solo lo que cada página
+# necesita. Los archivos dentro de un ZIP se leen de a uno: los chicos a
+# memoria y los grandes a un temporal. Después de cada página se sueltan
+# pixmaps y caché.
+ARCHIVE_MEMORY_MAX_MB = 256  # Miembros de ZIP más grandes van a un temporal en vez de a memoria
+TESSERACT_IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp")
+SUPPORTED_EXTENSIONS = (".pdf",) + TESSERACT_IMAGE_EXTENSIONS
+
+def describe_input(source):
+    """Nombre legible de una entrada (ruta o archivo en memoria)"""
+    if isinstance(source, str):
+        return source
+    return getattr(source, "name", "<archivo en memoria>")
+
+def open_input_pdf(source):
+    """Abre un PDF desde una ruta, bytes o un archivo abierto"""
+    if isinstance(source, str):
+        return fitz.open(source)
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    if isinstance(source, io.BytesIO):
+        # getvalue() no copia si el BytesIO se creó desde bytes y no se modificó
+        return fitz.open(stream=source.getvalue(), filetype="pdf")
+    return fitz.open(stream=source.read(), filetype="pdf")
+
+def iter_archive_inputs(zip_path):
+    """Recorre los PDFs e imágenes de un ZIP sin extraerlo entero
+
+    Devuelve (nombre, entrada) de a uno: cada miembro se lee recién cuando
+    se lo pide y se libera al pasar al siguiente. Hasta
+    ARCHIVE_MEMORY_MAX_MB la entrada es un archivo en memoria; los miembros
+    más grandes se descomprimen por bloques a un temporal y la entrada es
+    su ruta, para que MuPDF los lea del disco como cualquier PDF.
+    """
+    with zipfile.ZipFile(zip_path) as archive:
+        for member in archive.infolist():
+            if member.is_dir() or not member.filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                continue
+            if member.file_size <= ARCHIVE_MEMORY_MAX_MB * 1024 * 1024:
+                data = io.BytesIO(archive.read(member))
+                data.name = member.filename
+                yield member.filename, data
+                data = None
+                continue
+            
+            with GOVERNOR.temp_dir("ocr_mad_zip_") as temp_dir:
+                temp_path = os.path.join(temp_dir, os.path.basename(member.filename))
+                with archive.open(member) as src, open(temp_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                logging.info(f"{member.filename} ({member.file_size / 1024 / 1024:.0f} MB) copiado a un temporal")
+                yield member.filename, temp_path
+
+def archive_output_path(zip_path, member_name):
+    """Salida para un miembro de ZIP: carpeta <zip>_OCR junto al archivo"""
+    out_dir = f"{os.path.splitext(zip_path)[0]}_OCR"
+    os.makedirs(out_dir, exist_ok=True)
+    flat_name = member_name.replace("/", "_").replace("\\", "_")
+    return os.path.join(out_dir, f"{os.path.splitext(flat_name)[0]}_OCR.pdf")
+
+def render_page_image(page, dpi, with_digest=False):
+    """Renderiza una página de PDF a imagen
+
+    Los píxeles pasan directo del pixmap a PIL (sin codificar a PNG) y el
+    pixmap se suelta enseguida para no tener dos copias de la página.
+    Con with_digest devuelve (imagen, SHA-256 de los píxeles), calculado
+    sobre el buffer del pixmap para no copiar la imagen otra vez.
+    """
+    mat = fitz.Matrix(dpi / 72, dpi / 72)
+    pix = page.get_pixmap(matrix=mat, alpha=False)
+    mode = "L" if pix.n == 1 else "RGB"
+    size = (pix.width, pix.height)
+    samples = pix.samples_mv
+    img = Image.frombytes(mode, size, samples)
+    digest = None
+    if with_digest:
+        digest = hashlib.sha256(f"{mode}{size}".encode())
+        digest.update(samples)
+        digest = digest.hexdigest()
+    samples = pix = None
+    if with_digest:
+        return img, digest
+    return img
+
+PNG_IMAGE_MODES = ("1", "L", "LA", "P", "RGB", "RGBA")
+
+def png_compatible_image(img):
+    """Convierte a un modo que PNG (y Tesseract) aceptan
+
+    CMYK o YCbCr pasan a RGB; las imágenes de 16 o 32 bits por canal
+    (I;16, I, F) pasan a escala de grises de 8 bits.
+    """
+    if img.mode in PNG_IMAGE_MODES:
+        return img
+    if img.mode == "F":
+        return img.convert("L")
+    if img.mode.startswith("I"):
+        # Llevar el rango de 16 bits a 0-255 antes de pasar a 8 bits
+        return img.convert("I").point(lambda value: value * (1 / 256)).convert("L")
+    return img.convert("RGB")
+
+def release_page_memory():
+    """Libera la caché interna de MuPDF (imágenes decodificadas de páginas ya procesadas)"""
+    fitz.TOOLS.store_shrink(100)
+
+# === DETECCIÓN DE IDIOMA ===
+# Palabras muy frecuentes y exclusivas de cada idioma (sin las que comparten)
+LANGUAGE_STOPWORDS = {
+    "spa": {
+        "de", "la", "que", "el", "en", "los", "del", "se", "las", "por", "un", "para",
+        "con", "una", "su", "al", "lo", "como", "más", "pero", "sus", "le", "ya", "este",
+        "porque", "esta", "entre", "cuando", "muy", "sin", "sobre", "también", "hasta",
+        "hay", "donde", "desde", "todo", "nos", "durante", "todos", "uno", "les", "ni",
+        "otros", "ese", "eso", "ellos", "esto", "antes", "algunos", "qué", "unos", "yo",
+        "otro", "otras", "otra", "él", "mucho", "nada", "ella", "estar", "estas", "es",
+        "fue", "ha", "está", "según", "año", "señor", "artículo",
+    },
+    "eng": {
+        "the", "of", "and", "to", "is", "that", "it", "for", "was", "on", "are", "with",
+        "his", "they", "at", "be", "this", "have", "from", "or", "one", "had", "by",
+        "but", "not", "what", "all", "were", "we", "when", "your", "can", "said",
+        "there", "an", "each", "which", "she", "do", "how", "their", "if", "will",
+        "up", "other", "about", "out", "many", "then", "them", "these", "so", "some",
+        "her", "would", "him", "into", "has", "more", "been", "who", "its", "now",
+        "than", "shall", "any", "our", "you",
+    },
+}
+LANG_SAMPLE_PAGES = 3      # Páginas que se muestrean por documento
+LANG_SAMPLE_DPI = 150      # Resolución de la muestra (alcanza para detectar idioma)
+LANG_TEXT_LAYER_MIN = 200  # Caracteres mínimos para confiar en la capa de texto existente
+LANG_MIN_WORDS = 10        # Palabras reconocidas mínimas para decidir algo
+LANG_MIN_SHARE = 0.15      # Proporción mínima para que un idioma quede
+
+def score_languages(text, candidates):
+    """Cuenta cuántas palabras del texto pertenecen a cada idioma candidato"""
+    words = re.findall(r"[^\W\d_]+", text.lower())
+    return {
+        lang: sum(1 for w in words if w in LANGUAGE_STOPWORDS[lang])
+        for lang in candidates if lang in LANGUAGE_STOPWORDS
+    }
+
+def pick_languages(scores, candidates):
+    """Elige los idiomas dominantes; ante poca evidencia se queda con todos"""
+    total = sum(scores.values())
+    if total < LANG_MIN_WORDS:
+        return list(candidates)
+    picked = sorted(
+        (lang for lang, count in scores.items() if count >= total * LANG_MIN_SHARE),
+        key=lambda lang: scores[lang],
+        reverse=True
+    )
+    # Los idiomas sin lista de palabras no se pueden descartar
+    picked.extend(lang for lang in candidates if lang not in LANGUAGE_STOPWORDS)
+    return picked or list(candidates)
+
+def sample_page_numbers(total_pages, count=LANG_SAMPLE_PAGES):
+    """Índices de páginas repartidos a lo largo del documento"""
+    if total_pages <= count:
+        return list(range(total_pages))
+    step = total_pages / count
+    return sorted({int(step * i + step / 2) for i in range(count)})
+
+def ocr_sample_text(page, profile, tessdata_dir):
+    """OCR rápido de una página a baja resolución, solo texto"""
+    with GOVERNOR.temp_dir("ocr_mad_lang_") as temp_dir:
+        img = render_page_image(page, LANG_SAMPLE_DPI)
+        if profile["preprocess"]:
+            img = preprocess_image(img)
+        temp_img_path = os.path.join(temp_dir, "sample.png")
+        img.save(temp_img_path, dpi=(LANG_SAMPLE_DPI, LANG_SAMPLE_DPI))
+        
+        sample_profile = dict(profile, dpi=LANG_SAMPLE_DPI)
+        cmd = build_tesseract_cmd(temp_img_path, "stdout", sample_profile, tessdata_dir, create_pdf=False)
+        GOVERNOR.acquire()
+        try:
+            result = GOVERNOR.run_tesseract(cmd, encoding="utf-8")
+        finally:
+            GOVERNOR.release()
+        if result.returncode != 0:
+            logging.warning(f"Tesseract falló en la muestra de idioma: {result.stderr}")
+            return ""
+        return result.stdout
+
+def detect_document_languages(doc, profile, tessdata_dir=""):
+    """Detecta los idiomas dominantes de un documento a partir de unas pocas páginas
+
+    Usa la capa de texto si el PDF ya la tiene; si no, hace un OCR rápido de
+    la muestra con todos los idiomas del perfil. Devuelve (idiomas, fuente).
+    """
+    candidates = [lang for lang in profile["langs"].split("+") if lang]
+    if len(candidates) < 2:
+        return profile["langs"], "perfil"
+    
+    texts = []
+    source = "capa de texto"
+    for index in sample_page_numbers(len(doc)):
+        page = doc[index]
+        text = page.get_text("text")
+        if len(text.strip()) < LANG_TEXT_LAYER_MIN:
+            source = "muestra OCR"
+            text = ocr_sample_text(page, profile, tessdata_dir)
+        texts.append(text)
+    
+    scores = score_languages("\n".join(texts), candidates)
+    langs = "+".join(pick_languages(scores, candidates))
+    logging.info(f"Detección de idioma ({source}): puntajes {scores} -> {langs}")
+    return langs, source
+
+def choose_document_languages(doc, profile, tessdata_dir=""):
+    """Devuelve el perfil con los idiomas detectados (si el perfil lo pide) y la fuente"""
+    lang_source = "perfil"
+    if profile.get("detect_language") and len(doc):
+        try:
+            langs, lang_source = detect_document_languages(doc, profile, tessdata_dir)
+            profile = dict(profile, langs=langs)
+        except Exception as e:
+            logging.warning(f"No se pudo detectar el idioma, se usan todos los del perfil: {e}")
+    logging.info(f"Idiomas para el OCR: {profile['langs']} (según {lang_source})")
+    return profile, lang_source
+
+def ocr_keywords(profile_name, profile, lang_source):
+    """Texto que se guarda en las palabras clave del PDF de salida"""
+    return f"OCR-MAD perfil={profile_name or DEFAULT_PROFILE}; idiomas={profile['langs']}; fuente={lang_source}"
+
+# === DEDUPLICACIÓN DE PÁGINAS ===
+# En lotes escaneados se repiten carátulas, separadores y dorsos en blanco.
+# Las páginas idénticas (mismos píxeles) reutilizan el OCR ya hecho; las
+# casi idénticas (hash perceptual parecido) solo se informan.
+DEDUP_CACHE_MAX_MB = 64       # Tope de resultados de OCR guardados para reutilizar
+DEDUP_NEAR_WINDOW = 256       # Páginas recientes contra las que se buscan casi duplicados
+DEDUP_REPORT_MAX = 200        # Ejemplos de duplicados que se guardan para el resumen
+DEDUP_NEAR_THRESHOLD = 0.95   # Similitud mínima para avisar de casi duplicados
+
+def new_dedup_index():
+    """Crea un índice de páginas vistas (se puede compartir entre documentos)
+
+    Todo lo que guarda está acotado, así que se puede usar en lotes de
+    cualquier tamaño: los resultados por tamaño en bytes, los hashes
+    perceptuales y los ejemplos del resumen por cantidad.
+    """
+    return {
+        "results": OrderedDict(),  # clave (hash + perfil) -> (PDF de la página, documento, página)
+        "results_bytes": 0,        # tamaño total de los PDFs guardados
+        "inflight": {},            # clave -> (future del OCR en curso, documento, página)
+        "pages": 0,                # páginas analizadas
+        "exact_count": 0,
+        "near_count": 0,
+        "phashes": deque(maxlen=DEDUP_NEAR_WINDOW),  # (hash perceptual, hash exacto, documento, página)
+        "exact": deque(maxlen=DEDUP_REPORT_MAX),     # (documento, página, doc. original, pág. original)
+        "near": deque(maxlen=DEDUP_REPORT_MAX),      # (documento, página, doc. parecido, pág. parecida, similitud)
+    }
+
+def page_hashes(img, exact=None):
+    """Hash exacto de los píxeles y hash perceptual (dHash de 64 bits)
+
+    exact es el SHA-256 que ya calculó render_page_image; si falta se
+    calcula acá (eso copia los píxeles de la imagen una vez).
+    """
+    if exact is None:
+        exact = hashlib.sha256(f"{img.mode}{img.size}".encode() + img.tobytes()).hexdigest()
+    # Achicar antes de pasar a grises: así no se copia la página entera
+    small = img.resize((9, 8), Image.Resampling.BILINEAR).convert("L")
+    pixels = small.tobytes()
+    phash = 0
+    for row in range(8):
+        for col in range(8):
+            phash = (phash << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return exact, phash
+
+def dedup_check(index, img, profile, source, n, exact=None):
+    """Registra la página y devuelve (clave, reutilizable, original)
+
+    reutilizable es el PDF ya reconocido de una copia exacta, el future de
+    una copia que todavía se está reconociendo, o None si hay que hacer el
+    OCR. original es (documento, página) de la copia reutilizada.
+    """
+    exact, phash = page_hashes(img, exact)
+    key = (exact, profile["langs"], profile["dpi"], profile["oem"], profile["psm"],
+           profile["preprocess"], profile["tessdata"])
+    index["pages"] += 1
+    
+    cached = index["results"].get(key)
+    if cached is not None:
+        index["results"].move_to_end(key)
+        pdf_bytes, orig_source, orig_n = cached
+        return key, pdf_bytes, (orig_source, orig_n)
+    if key in index["inflight"]:
+        future, orig_source, orig_n = index["inflight"][key]
+        return key, future, (orig_source, orig_n)
+    
+    # Casi duplicados: solo contra las últimas páginas vistas
+    for other_phash, other_exact, other_source, other_n in index["phashes"]:
+        similarity = 1 - (phash ^ other_phash).bit_count() / 64
+        if similarity >= DEDUP_NEAR_THRESHOLD and other_exact != exact:
+            index["near_count"] += 1
+            index["near"].append((source, n, other_source, other_n, similarity))
+            logging.info(f"{os.path.basename(source)} pág. {n} casi igual a {os.path.basename(other_source)} pág. {other_n} ({similarity:.0%})")
+            break
+    index["phashes"].append((phash, exact, source, n))
+    return key, None, None
+
+def dedup_mark_reused(index, source, n, original):
+    """Cuenta una página cuyo OCR se tomó efectivamente de una copia exacta"""
+    orig_source, orig_n = original
+    index["exact_count"] += 1
+    index["exact"].append((source, n, orig_source, orig_n))
+    logging.info(f"{os.path.basename(source)} pág. {n} idéntica a {os.path.basename(orig_source)} pág. {orig_n}: se reutiliza el OCR")
+
+def dedup_track(index, key, future, source, n):
+    """Anota un OCR en curso para que las copias que aparezcan lo esperen"""
+    index["inflight"][key] = (future, source, n)
+
+def dedup_store(index, key, pdf_bytes, source, n):
+    """Guarda el OCR de una página para reutilizarlo en copias exactas
+
+    Descarta los resultados usados hace más tiempo cuando el total supera
+    DEDUP_CACHE_MAX_MB.
+    """
+    index["inflight"].pop(key, None)
+    max_bytes = DEDUP_CACHE_MAX_MB * 1024 * 1024
+    if len(pdf_bytes) > max_bytes:
+        return
+    previous = index["results"].pop(key, None)
+    if previous is not None:
+        index["results_bytes"] -= len(previous[0])
+    index["results"][key] = (pdf_bytes, source, n)
+    index["results_bytes"] += len(pdf_bytes)
+    while index["results_bytes"] > max_bytes:
+        _, (old_bytes, _, _) = index["results"].popitem(last=False)
+        index["results_bytes"] -= len(old_bytes)
+
+def dedup_report(index):
+    """Resumen legible de duplicados exactos y casi duplicados"""
+    lines = [
+        f"Páginas analizadas: {index['pages']}",
+        f"Duplicados exactos: {index['exact_count']}",
+        f"Casi duplicados: {index['near_count']}",
+    ]
+    if index["exact_count"] > len(index["exact"]) or index["near_count"] > len(index["near"]):
+        lines.append(f"  (se listan los últimos {DEDUP_REPORT_MAX} de cada tipo)")
+    for source, n, orig_source, orig_n in index["exact"]:
+        lines.append(f"  = {os.path.basename(source)} pág. {n} -> {os.path.basename(orig_source)} pág. {orig_n}")
+    for source, n, other_source, other_n, similarity in index["near"]:
+        lines.append(
+            f"  ~ {os.path.basename(source)} pág. {n} -> {os.path.basename(other_source)} pág. {other_n} ({similarity:.0%})"
+        )
+    return "\n".join(lines)
+
+# === OCR DE UNA PÁGINA DE PDF ===
+def prepare_page(page, n, profile, dedup_index=None, source=""):
+    """Renderiza y preprocesa una página
+
+    Devuelve (imagen, clave de deduplicación, reutilizable, original) como
+    dedup_check; si hay algo reutilizable no hace falta la imagen. Usa
+    PyMuPDF, así que tiene que llamarse desde el hilo que abrió el documento.
+    """
+    logging.debug(f"Procesando página {n}")
+    # Renderizar página a imagen de alta resolución
+    dedup_key = None
+    if dedup_index is None:
+        img = render_page_image(page, profile["dpi"])
+    else:
+        # Si ya se vio esta misma página, reutilizar su OCR
+        img, exact = render_page_image(page, profile["dpi"], with_digest=True)
+        dedup_key, reuse, original = dedup_check(dedup_index, img, profile, source, n, exact)
+        if reuse is not None:
+            return None, dedup_key, reuse, original
+    
+    if profile["preprocess"]:
+        img = preprocess_image(img)
+    return img, dedup_key, None, None
+
+def ocr_page_image_pdf(img, n, profile, tessdata_dir=""):
+    """Corre Tesseract sobre la imagen de una página y devuelve el PDF con texto
+
+    No toca PyMuPDF, así que se puede correr en varios hilos a la vez.
+    """
+    dpi = profile["dpi"]
+    
+    # Usar una carpeta temporal específica para este proceso (se borra también si falla)
+    with GOVERNOR.temp_dir("ocr_mad_") as temp_dir:
+        temp_img_path = os.path.join(temp_dir, f"page_{n}_input.png")
+        temp_output_base = os.path.join(temp_dir, f"page_{n}_output")
         
-        # Abrir documento
-        doc = fitz.open(input_pdf)
-        out_doc = fitz.open()
-        total_pages = len(doc)
-        logging.info(f"Total de páginas: {total_pages}")
+        # Guardar imagen temporal
+        img.save(temp_img_path, dpi=(dpi, dpi))
+        logging.debug(f"Imagen temporal guardada en: {temp_img_path}")
         
-        # Procesar cada página
-        for n, page in enumerate(doc, start=1):
-            if progress_callback:
-                progress_callback(n, total_pages, f"Página {n}/{total_pages}")
+        # ¡¡¡SINTAXIS CORRECTA PARA TESSERACT 5.5.0!!!
+        cmd = build_tesseract_cmd(temp_img_path, temp_output_base, profile, tessdata_dir)
+        
+        logging.debug(f"Ejecutando comando CORRECTO v2: {' '.join(cmd)}")
+        
+        # Ejecutar Tesseract directamente
+        result = GOVERNOR.run_tesseract(cmd)
+        
+        # Mostrar salida de Tesseract para diagnóstico
+        if result.stdout.strip():
+            logging.debug(f"Tesseract stdout: {result.stdout}")
+        if result.stderr.strip():
+            logging.debug(f"Tesseract stderr: {result.stderr}")
+        
+        if result.returncode != 0:
+            logging.error(f"Error Tesseract (página {n}): {result.stderr}")
+            logging.error(f"Código de retorno: {result.returncode}")
+            # Intentar con configuración más simple
+            logging.warning("Intentando con configuración más simple...")
+            simpler_cmd = build_tesseract_cmd(
+                temp_img_path, temp_output_base, profile, tessdata_dir, simple=True
+            )
             
-            try:
-                logging.debug(f"Procesando página {n}")
-                # Renderizar página a imagen de alta resolución
-                mat = fitz.Matrix(300 / 72, 300 / 72)  # 300 DPI
-                pix = page.get_pixmap(matrix=mat)
-                img_data = pix.tobytes("png")
-                img = Image.open(io.BytesIO(img_data))
-                img = preprocess_image(img)
-                
-                # Usar una carpeta temporal específica para este proceso
-                temp_dir = tempfile.mkdtemp(prefix="ocr_mad_")
-                temp_img_path = os.path.join(temp_dir, f"page_{n}_input.png")
-                temp_output_base = os.path.join(temp_dir, f"page_{n}_output")
-                
-                # Guardar imagen temporal
-                img.save(temp_img_path)
-                logging.debug(f"Imagen temporal guardada en: {temp_img_path}")
-                
-                # Configurar comando Tesseract con sintaxis CORRECTA para Tesseract 5.5.0
-                tesseract_cmd = pytesseract.pytesseract.tesseract_cmd
-                tessdata_dir = os.environ.get("TESSDATA_PREFIX", "")
-                
-                # ¡¡¡SINTAXIS CORRECTA PARA TESSERACT 5.5.0!!!
-                cmd = [
-                    tesseract_cmd,
-                    temp_img_path,
-                    temp_output_base,  # Base name sin extensión
-                    '-l', 'spa+eng',
-                    '--oem', '1',
-                    '--psm', '3',
-                    '-c', 'preserve_interword_spaces=1',
-                    '-c', 'tessedit_create_pdf=1'  # ¡¡¡ESTA ES LA FORMA CORRECTA DE GENERAR PDF!!!
-                ]
-                
-                if tessdata_dir:
-                    cmd.extend(['--tessdata-dir', tessdata_dir])
-                
-                logging.debug(f"Ejecutando comando CORRECTO v2: {' '.join(cmd)}")
-                
-                # Ejecutar Tesseract directamente
-                result = subprocess.run(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    check=False
-                )
-                
-                # Mostrar salida de Tesseract para diagnóstico
-                if result.stdout.strip():
-                    logging.debug(f"Tesseract stdout: {result.stdout}")
-                if result.stderr.strip():
-                    logging.debug(f"Tesseract stderr: {result.stderr}")
-                
-                if result.returncode != 0:
-                    logging.error(f"Error Tesseract (página {n}): {result.stderr}")
-                    logging.error(f"Código de retorno: {result.returncode}")
-                    # Intentar con configuración más simple
-                    logging.warning("Intentando con configuración más simple...")
-                    simpler_cmd = [
-                        tesseract_cmd,
-                        temp_img_path,
-                        temp_output_base,
-                        '-l', 'spa+eng',
-                        '--oem', '1',
-                        '--psm', '3',
-                        '-c', 'tessedit_create_pdf=1'
-                    ]
-                    if tessdata_dir:
-                        simpler_cmd.extend(['--tessdata-dir', tessdata_dir])
-                    
-                    simpler_result = subprocess.run(
-                        simpler_cmd,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        text=True,
-                        check=False
-                    )
-                    
-                    if simpler_result.returncode != 0:
-                        logging.error(f"Error Tesseract simple (página {n}): {simpler_result.stderr}")
-                        raise Exception(f"Tesseract falló en página {n}")
-                
-                # El archivo PDF se genera con el mismo nombre base + .pdf
-                temp_pdf_path = f"{temp_output_base}.pdf"
-                
-                # Verificar que el archivo PDF se creó
-                if not os.path.exists(temp_pdf_path):
-                    # Intentar con la extensión .PDF (a veces Windows es sensible a mayúsculas/minúsculas)
-                    alt_path = temp_pdf_path.replace('.pdf', '.PDF')
-                    if os.path.exists(alt_path):
-                        temp_pdf_path = alt_path
-                    else:
-                        logging.error(f"Archivo PDF no encontrado: {temp_pdf_path}")
-                        logging.error(f"Contenido de carpeta temporal:")
-                        for file in os.listdir(temp_dir):
-                            logging.error(f"  - {file}")
-                        # Mostrar el comando exacto que falló
-                        logging.error(f"Comando ejecutado: {' '.join(cmd)}")
-                        raise FileNotFoundError(f"No se encontró archivo PDF para página {n}")
-                
-                logging.debug(f"PDF generado: {temp_pdf_path} ({os.path.getsize(temp_pdf_path)} bytes)")
-                
-                # Leer el PDF generado
-                with open(temp_pdf_path, 'rb') as f:
-                    pdf_bytes = f.read()
-                
-                # Convertir a PDF y añadir al documento final
-                ocr_page = fitz.open("pdf", pdf_bytes)
-                out_doc.insert_pdf(ocr_page)
-                ocr_page.close()
-                logging.debug(f"Página {n} procesada correctamente")
-                
-                # Limpiar archivos temporales
+            simpler_result = GOVERNOR.run_tesseract(simpler_cmd)
+            
+            if simpler_result.returncode != 0:
+                logging.error(f"Error Tesseract simple (página {n}): {simpler_result.stderr}")
+                raise Exception(f"Tesseract falló en página {n}")
+        
+        # El archivo PDF se genera con el mismo nombre base + .pdf
+        temp_pdf_path = f"{temp_output_base}.pdf"
+        
+        # Verificar que el archivo PDF se creó
+        if not os.path.exists(temp_pdf_path):
+            # Intentar con la extensión .PDF (a veces Windows es sensible a mayúsculas/minúsculas)
+            alt_path = temp_pdf_path.replace('.pdf', '.PDF')
+            if os.path.exists(alt_path):
+                temp_pdf_path = alt_path
+            else:
+                logging.error(f"Archivo PDF no encontrado: {temp_pdf_path}")
+                logging.error(f"Contenido de carpeta temporal:")
+                for file in os.listdir(temp_dir):
+                    logging.error(f"  - {file}")
+                # Mostrar el comando exacto que falló
+                logging.error(f"Comando ejecutado: {' '.join(cmd)}")
+                raise FileNotFoundError(f"No se encontró archivo PDF para página {n}")
+        
+        logging.debug(f"PDF generado: {temp_pdf_path} ({os.path.getsize(temp_pdf_path)} bytes)")
+        
+        # Leer el PDF generado
+        with open(temp_pdf_path, 'rb') as f:
+            pdf_bytes = f.read()
+        
+        return pdf_bytes
+
+def _governed_page_ocr(img, n, profile, tessdata_dir):
+    """OCR de una página en un hilo del pool; libera el turno del gobernador al terminar"""
+    try:
+        return ocr_page_image_pdf(img, n, profile, tessdata_dir)
+    finally:
+        GOVERNOR.release()
+
+def submit_page(pool, page, n, profile, tessdata_dir="", dedup_index=None, source=""):
+    """Renderiza una página y manda su OCR al pool
+
+    Espera turno de GOVERNOR antes de enviar (eso limita también cuántas
+    imágenes hay en memoria). Si la página es copia exacta de otra ya
+    reconocida o en curso, no se envía nada y se reutiliza ese resultado.
+    Devuelve un pendiente para finish_page.
+    """
+    img, dedup_key, reuse, original = prepare_page(page, n, profile, dedup_index, source)
+    entry = {"n": n, "source": source, "key": dedup_key, "original": original,
+             "future": None, "pdf_bytes": None, "owner": False}
+    if isinstance(reuse, bytes):
+        dedup_mark_reused(dedup_index, source, n, original)
+        entry["pdf_bytes"] = reuse
+        return entry
+    if reuse is not None:
+        entry["future"] = reuse
+        return entry
+    
+    GOVERNOR.acquire()
+    try:
+        entry["future"] = pool.submit(_governed_page_ocr, img, n, profile, tessdata_dir)
+    except Exception:
+        GOVERNOR.release()
+        raise
+    entry["owner"] = True
+    if dedup_key is not None:
+        dedup_track(dedup_index, dedup_key, entry["future"], source, n)
+    return entry
+
+def page_entry_done(entry):
+    """True si el pendiente ya se puede cerrar sin esperar"""
+    return entry["future"] is None or entry["future"].done()
+
+def finish_page(entry, dedup_index=None):
+    """Espera el OCR de un pendiente de submit_page y devuelve el PDF de la página"""
+    if entry["future"] is None:
+        return entry["pdf_bytes"]
+    try:
+        pdf_bytes = entry["future"].result()
+    except Exception:
+        if entry["owner"] and entry["key"] is not None:
+            dedup_index["inflight"].pop(entry["key"], None)
+        raise
+    if entry["owner"]:
+        if entry["key"] is not None:
+            dedup_store(dedup_index, entry["key"], pdf_bytes, entry["source"], entry["n"])
+    else:
+        dedup_mark_reused(dedup_index, entry["source"], entry["n"], entry["original"])
+    return pdf_bytes
+
+# === OCR PARA PDF - CORREGIDO DEFINITIVO ===
+def ocr_document_pages(doc, page_numbers, profile, tessdata_dir="", dedup_index=None, source="", progress_callback=None):
+    """Reconoce las páginas pedidas (numeradas desde 1) en paralelo
+
+    Devuelve (n, PDF de la página) en el mismo orden; el PDF es None si esa
+    página falló. Las páginas se renderizan en este hilo (PyMuPDF no es
+    thread-safe) y Tesseract corre en un pool con turnos de GOVERNOR.
+    """
+    total_pages = len(page_numbers)
+    pending = deque()
+    
+    def collect(block):
+        while pending and (block or pending[0][1] is None or page_entry_done(pending[0][1])):
+            n, entry = pending.popleft()
+            pdf_bytes = None
+            if entry is not None:
                 try:
-                    os.unlink(temp_img_path)
-                    os.unlink(temp_pdf_path)
-                    os.rmdir(temp_dir)
+                    pdf_bytes = finish_page(entry, dedup_index)
                 except Exception as e:
-                    logging.warning(f"No se pudieron limpiar archivos temporales: {e}")
-                
+                    logging.error(f"Error en página {n}: {traceback.format_exc()}")
+            yield n, pdf_bytes
+    
+    with ThreadPoolExecutor(max_workers=GOVERNOR.settings["max_workers"]) as pool:
+        for index, n in enumerate(page_numbers, start=1):
+            if progress_callback:
+                progress_callback(index, total_pages, f"Página {n}/{len(doc)}")
+            
+            try:
+                entry = submit_page(pool, doc[n - 1], n, profile, tessdata_dir, dedup_index, source)
+                pending.append((n, entry))
             except Exception as e:
                 logging.error(f"Error en página {n}: {traceback.format_exc()}")
-                continue
+                pending.append((n, None))
+            finally:
+                release_page_memory()
+            
+            yield from collect(block=False)
+        yield from collect(block=True)
+
+OUTPUT_FLUSH_PAGES = 50  # Páginas de salida que se juntan en memoria antes de bajarlas a disco
+
+class OutputPdfWriter:
+    """PDF de salida que se va escribiendo a disco cada OUTPUT_FLUSH_PAGES páginas
+
+    Se escribe en output_pdf + ".tmp" (guardado completo la primera vez,
+    incremental después) y se reabre, así en memoria quedan solo las
+    páginas nuevas. finish() reemplaza output_pdf recién al final, y
+    discard() borra el temporal sin tocar una salida anterior.
+    """
+    
+    def __init__(self, output_pdf):
+        self.output_pdf = output_pdf
+        self.temp_path = f"{output_pdf}.tmp"
+        self.doc = fitz.open()
+        self.pending = 0
+        self.on_disk = False
+    
+    def add_page(self, doc, n, pdf_bytes):
+        """Como insert_page_or_original, bajando a disco cuando corresponde"""
+        recognized = insert_page_or_original(self.doc, doc, n, pdf_bytes)
+        self.pending += 1
+        if self.pending >= OUTPUT_FLUSH_PAGES:
+            self.flush()
+        return recognized
+    
+    def _save(self):
+        if self.on_disk:
+            self.doc.saveIncr()
+        else:
+            self.doc.save(self.temp_path)
+            self.on_disk = True
+    
+    def flush(self):
+        """Escribe las páginas pendientes y las suelta de memoria"""
+        if self.pending == 0:
+            return
+        logging.debug(f"Escribiendo {self.pending} páginas en {self.temp_path}")
+        self._save()
+        self.doc.close()
+        self.doc = fitz.open(self.temp_path)
+        self.pending = 0
+    
+    def finish(self):
+        """Guarda lo que falte (metadatos, manifiesto) y deja el PDF en output_pdf"""
+        self._save()
+        self.doc.close()
+        os.replace(self.temp_path, self.output_pdf)
+    
+    def discard(self):
+        """Cierra sin guardar y borra el temporal"""
+        if not self.doc.is_closed:
+            self.doc.close()
+        if self.on_disk and os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+def insert_page_or_original(out_doc, doc, n, pdf_bytes):
+    """Agrega al final la página reconocida o, si falló, la original sin OCR
+
+    Así el PDF de salida tiene siempre una página por cada página de
+    entrada y en el mismo orden. Devuelve True si quedó la versión con OCR.
+    """
+    if pdf_bytes is not None:
+        try:
+            ocr_page = fitz.open("pdf", pdf_bytes)
+            out_doc.insert_pdf(ocr_page)
+            ocr_page.close()
+            return True
+        except Exception as e:
+            logging.error(f"Error en página {n}: {traceback.format_exc()}")
+    logging.warning(f"Página {n} sin OCR: se deja la original")
+    out_doc.insert_pdf(doc, from_page=n - 1, to_page=n - 1)
+    return False
+
+def ocr_pdf(input_pdf, output_pdf: str, progress_callback=None, profile_name=None, dedup_index=None):
+    """Realiza OCR en un archivo PDF y genera un PDF con texto seleccionable
+
+    input_pdf puede ser una ruta, bytes o un archivo abierto. dedup_index
+    permite reutilizar el OCR de páginas repetidas entre varios documentos;
+    si no se pasa, se deduplica solo dentro de este PDF. Las páginas se
+    reconocen en paralelo hasta donde lo permita GOVERNOR.
+    """
+    writer = None
+    try:
+        logging.info(f"Iniciando OCR para PDF: {describe_input(input_pdf)}")
+        logging.info(f"Archivo de salida: {output_pdf}")
+        profile = get_profile(profile_name)
+        tessdata_dir = resolve_tessdata_dir(profile)
+        dpi = profile["dpi"]
+        logging.info(f"Perfil de OCR: {profile_name or DEFAULT_PROFILE} ({profile['langs']}, {dpi} DPI)")
+        
+        # Abrir documento (las páginas se cargan recién al recorrerlas)
+        doc = open_input_pdf(input_pdf)
+        writer = OutputPdfWriter(output_pdf)
+        total_pages = len(doc)
+        logging.info(f"Total de páginas: {total_pages}")
+        
+        # Reducir los modelos a los idiomas que realmente tiene el documento
+        profile, lang_source = choose_document_languages(doc, profile, tessdata_dir)
+        if dedup_index is None:
+            dedup_index = new_dedup_index()
+        
+        # Procesar cada página (las que fallan quedan sin OCR y sin huella,
+        # así el reprocesamiento incremental las vuelve a intentar)
+        fingerprints = []
+        ocr_pages = 0
+        pages = ocr_document_pages(
+            doc, list(range(1, total_pages + 1)), profile, tessdata_dir,
+            dedup_index, describe_input(input_pdf), progress_callback
+        )
+        for n, pdf_bytes in pages:
+            if writer.add_page(doc, n, pdf_bytes):
+                ocr_pages += 1
+                fingerprints.append(page_fingerprint(doc, n))
+                logging.debug(f"Página {n} procesada correctamente")
+            else:
+                fingerprints.append(None)
+        
+        logging.info(f"Deduplicación:\n{dedup_report(dedup_index)}")
         
-        # Guardar documento final solo si hay páginas
-        if out_doc.page_count == 0:
+        # Guardar documento final solo si se reconoció alguna página
+        if ocr_pages == 0:
             error_msg = "No se pudo procesar ninguna página. Verifica que el PDF tenga contenido visible y que Tesseract esté funcionando correctamente."
             logging.error(error_msg)
-            out_doc.close()
+            writer.discard()
             raise ValueError(error_msg)
         
         logging.info("Guardando documento final")
-        out_doc.save(output_pdf)
+        # Dejar registrado en el PDF con qué idiomas se reconoció
+        metadata = writer.doc.metadata or {}
+        metadata["keywords"] = ocr_keywords(profile_name, profile, lang_source)
+        writer.doc.set_metadata(metadata)
+        # Huellas de las páginas de entrada para poder reprocesar solo lo nuevo
+        write_page_manifest(writer.doc, profile_name, profile, lang_source, fingerprints)
+        writer.finish()
         file_size = os.path.getsize(output_pdf) / 1024 / 1024
         logging.info(f"Archivo guardado: {output_pdf} ({file_size:.2f} MB)")
         
-        # Cerrar documentos
-        out_doc.close()
+        # Cerrar documento de entrada
         doc.close()
         
         return True
         
     except Exception as e:
         logging.error(f"Error crítico en ocr_pdf: {traceback.format_exc()}")
+        if writer is not None:
+            writer.discard()
+        raise
+
+# === REPROCESAMIENTO INCREMENTAL ===
+# El PDF de salida guarda (en una clave propia del catálogo) la huella de
+# cada página de entrada. Si el expediente crece o cambian algunas páginas,
+# solo esas pasan por OCR y se empalman con un guardado incremental.
+PAGE_MANIFEST_KEY = "OCRMADManifest"
+
+PDF_REFERENCE = re.compile(rb"(\d+)\s+\d+\s+R\b")
+# Claves que apuntan fuera de la página (árbol de páginas, la propia página, destinos)
+PDF_BACK_REFERENCE = re.compile(rb"/(?:Parent|P|Popup|IRT|Dest|D)\s*\[?\s*\d+\s+\d+\s+R\b")
+
+def _pdf_object_digest(doc, definition, memo):
+    """Hash de una definición de objeto PDF con sus referencias resueltas
+
+    Cada referencia se reemplaza por el hash de lo que apunta (con sus
+    streams), así la huella no depende de cómo estén numerados o
+    compartidos los objetos en el archivo. No entra en otras páginas.
+    """
+    def resolve(match):
+        xref = int(match.group(1))
+        if not 0 < xref < doc.xref_length():
+            return b"R"
+        if xref not in memo:
+            memo[xref] = b"R"  # Corta ciclos mientras se calcula
+            if doc.xref_get_key(xref, "Type") != ("name", "/Page"):
+                digest = hashlib.sha256(_pdf_object_digest(doc, doc.xref_object(xref, compressed=True), memo))
+                if doc.xref_is_stream(xref):
+                    digest.update(doc.xref_stream_raw(xref) or b"")
+                memo[xref] = digest.hexdigest().encode()
+        return memo[xref]
+    
+    definition = PDF_BACK_REFERENCE.sub(b"", definition.encode("latin-1", "replace"))
+    return hashlib.sha256(PDF_REFERENCE.sub(resolve, definition)).digest()
+
+def page_fingerprint(doc, n):
+    """Huella de una página de entrada, sin renderizar
+
+    Incluye geometría, contenido y todo lo que cuelga de /Resources (imágenes,
+    fuentes y Form XObjects con sus propios recursos), además de las
+    anotaciones con sus apariencias: así cambia también en páginas armadas
+    con formularios (PDFs unidos o impuestos) o con sellos agregados.
+    """
+    page = doc[n - 1]
+    digest = hashlib.sha256(f"{tuple(page.rect)}{page.rotation}".encode())
+    digest.update(page.read_contents())
+    memo = {page.xref: b"R"}
+    for key in ("Resources", "Annots"):
+        # /Resources se puede heredar de los nodos padre del árbol de páginas
+        xref = page.xref
+        kind, value = doc.xref_get_key(xref, key)
+        parents = set()
+        while kind == "null" and key == "Resources":
+            parent_kind, parent = doc.xref_get_key(xref, "Parent")
+            if parent_kind != "xref" or parent in parents:
+                break
+            parents.add(parent)
+            xref = int(parent.split()[0])
+            kind, value = doc.xref_get_key(xref, key)
+        if kind != "null":
+            digest.update(key.encode())
+            digest.update(_pdf_object_digest(doc, value, memo))
+    return digest.hexdigest()[:32]
+
+def profile_settings(profile):
+    """Parámetros del perfil que cambian el resultado del OCR (sin los idiomas)"""
+    return [profile["dpi"], profile["oem"], profile["psm"], profile["preprocess"], profile["tessdata"]]
+
+def write_page_manifest(out_doc, profile_name, profile, lang_source, fingerprints):
+    """Guarda en el PDF de salida las huellas de sus páginas y el perfil usado"""
+    manifest = {
+        "version": 1,
+        "profile": profile_name or DEFAULT_PROFILE,
+        "settings": profile_settings(profile),
+        "langs": profile["langs"],
+        "lang_source": lang_source,
+        "pages": fingerprints,
+    }
+    out_doc.xref_set_key(
+        out_doc.pdf_catalog(), PAGE_MANIFEST_KEY, fitz.get_pdf_str(json.dumps(manifest, separators=(",", ":")))
+    )
+
+def read_page_manifest(doc):
+    """Lee las huellas guardadas por un OCR anterior (None si no hay)"""
+    try:
+        kind, value = doc.xref_get_key(doc.pdf_catalog(), PAGE_MANIFEST_KEY)
+        if kind != "string":
+            return None
+        manifest = json.loads(value)
+        return manifest if manifest.get("version") == 1 else None
+    except Exception as e:
+        logging.warning(f"No se pudieron leer las huellas del OCR anterior: {e}")
+        return None
+
+def ocr_pdf_incremental(input_pdf, output_pdf: str, progress_callback=None, profile_name=None, dedup_index=None):
+    """Como ocr_pdf, pero si output_pdf ya existe solo reconoce páginas nuevas o cambiadas
+
+    Si no hay un OCR anterior compatible (otro perfil, sin huellas, archivo
+    tocado a mano) hace el documento completo con ocr_pdf.
+    """
+    try:
+        name = profile_name or DEFAULT_PROFILE
+        profile = get_profile(profile_name)
+        if not isinstance(input_pdf, str) or not os.path.exists(output_pdf):
+            return ocr_pdf(input_pdf, output_pdf, progress_callback, profile_name, dedup_index)
+        
+        out_doc = fitz.open(output_pdf)
+        manifest = read_page_manifest(out_doc)
+        reason = None
+        if manifest is None:
+            reason = "el PDF de salida no tiene huellas de páginas"
+        elif manifest["profile"] != name or manifest["settings"] != profile_settings(profile):
+            reason = f"el OCR anterior usó otro perfil ({manifest['profile']})"
+        elif not profile.get("detect_language") and manifest["langs"] != profile["langs"]:
+            reason = "el OCR anterior usó otros idiomas"
+        elif len(manifest["pages"]) != out_doc.page_count:
+            reason = "el PDF de salida fue modificado después del OCR"
+        if reason:
+            out_doc.close()
+            logging.info(f"OCR completo de {input_pdf}: {reason}")
+            return ocr_pdf(input_pdf, output_pdf, progress_callback, profile_name, dedup_index)
+        
+        logging.info(f"Iniciando OCR incremental para PDF: {input_pdf}")
+        doc = open_input_pdf(input_pdf)
+        total_pages = len(doc)
+        old_pages = manifest["pages"]
+        new_pages = [page_fingerprint(doc, n) for n in range(1, total_pages + 1)]
+        changed = [
+            n for n in range(1, total_pages + 1)
+            if n > len(old_pages) or old_pages[n - 1] is None or old_pages[n - 1] != new_pages[n - 1]
+        ]
+        removed = max(0, len(old_pages) - total_pages)
+        logging.info(
+            f"Páginas: {total_pages} (antes {len(old_pages)}), a reconocer: {len(changed)}, a quitar: {removed}"
+        )
+        if not changed and not removed:
+            logging.info("Sin cambios: el PDF de salida ya está al día")
+            out_doc.close()
+            doc.close()
+            return True
+        
+        # Mismos idiomas que la vez anterior para que el documento quede parejo
+        profile = dict(profile, langs=manifest["langs"])
+        tessdata_dir = resolve_tessdata_dir(profile)
+        if dedup_index is None:
+            dedup_index = new_dedup_index()
+        
+        fingerprints = old_pages[:total_pages]
+        fingerprints.extend([None] * (total_pages - len(fingerprints)))
+        pages = ocr_document_pages(
+            doc, changed, profile, tessdata_dir, dedup_index, input_pdf, progress_callback
+        )
+        for n, pdf_bytes in pages:
+            index = n - 1
+            if pdf_bytes is not None:
+                source = fitz.open("pdf", pdf_bytes)
+                fingerprints[index] = new_pages[index]
+            else:
+                # Se deja la página original sin OCR; se reintenta la próxima vez
+                source = fitz.open()
+                source.insert_pdf(doc, from_page=index, to_page=index)
+                fingerprints[index] = None
+            if index < out_doc.page_count:
+                out_doc.insert_pdf(source, start_at=index)
+                out_doc.delete_page(index + 1)
+            else:
+                out_doc.insert_pdf(source)
+            source.close()
+        
+        if out_doc.page_count > total_pages:
+            out_doc.delete_pages(from_page=total_pages, to_page=out_doc.page_count - 1)
+        
+        write_page_manifest(out_doc, profile_name, profile, manifest["lang_source"], fingerprints)
+        if out_doc.can_save_incrementally():
+            out_doc.saveIncr()
+            logging.info(f"Guardado incremental: {output_pdf}")
+        else:
+            # Si MuPDF tuvo que reparar el archivo no se puede agregar al final: se reescribe
+            temp_path = f"{output_pdf}.tmp"
+            out_doc.save(temp_path)
+            out_doc.close()
+            os.replace(temp_path, output_pdf)
+            logging.info(f"El PDF de salida se reescribió completo: {output_pdf}")
+        if not out_doc.is_closed:
+            out_doc.close()
+        doc.close()
+        
+        file_size = os.path.getsize(output_pdf) / 1024 / 1024
+        logging.info(f"Archivo guardado: {output_pdf} ({file_size:.2f} MB)")
+        return True
+    
+    except Exception as e:
+        logging.error(f"Error crítico en ocr_pdf_incremental: {traceback.format_exc()}")
         raise
 
 # === OCR PARA IMÁGENES - CORREGIDO DEFINITIVO ===
-def ocr_image(input_image: str, output_pdf: str, progress_callback=None):
-    """Realiza OCR en una imagen y genera un PDF con texto seleccionable"""
+def ocr_image(input_image, output_pdf: str, progress_callback=None, profile_name=None):
+    """Realiza OCR en una imagen y genera un PDF con texto seleccionable
+
+    input_image puede ser una ruta o un archivo abierto (p. ej. un miembro de un ZIP).
+    """
+    temp_dir = None
     try:
-        logging.info(f"Iniciando OCR para imagen: {input_image}")
+        logging.info(f"Iniciando OCR para imagen: {describe_input(input_image)}")
         logging.info(f"Archivo de salida: {output_pdf}")
+        profile = get_profile(profile_name)
+        tessdata_dir = resolve_tessdata_dir(profile)
+        logging.info(f"Perfil de OCR: {profile_name or DEFAULT_PROFILE} ({profile['langs']})")
         
         if progress_callback:
             progress_callback(1, 1, "Procesando imagen")
         
-        # Abrir y preprocesar imagen
+        # Abrir imagen (Image.open solo lee la cabecera, los píxeles se cargan al usarlos)
         img = Image.open(input_image)
-        img = preprocess_image(img)
+        # Conservar la resolución original de la imagen si la trae
+        image_dpi = img.info.get("dpi")
         
-        # Usar carpeta temporal específica
+        # Usar carpeta temporal específica (cuenta para el cupo de disco)
         temp_dir = tempfile.mkdtemp(prefix="ocr_mad_img_")
-        temp_img_path = os.path.join(temp_dir, "input.png")
+        GOVERNOR.track_temp_dir(temp_dir)
         temp_output_base = os.path.join(temp_dir, "output")
         
-        # Guardar imagen temporal
-        img.save(temp_img_path)
-        
-        # Configurar comando Tesseract con sintaxis CORRECTA
-        tesseract_cmd = pytesseract.pytesseract.tesseract_cmd
-        tessdata_dir = os.environ.get("TESSDATA_PREFIX", "")
+        # Sin preprocesamiento, Tesseract puede leer el archivo original directamente
+        passthrough = (
+            not profile["preprocess"]
+            and isinstance(input_image, str)
+            and input_image.lower().endswith(TESSERACT_IMAGE_EXTENSIONS)
+            and getattr(img, "n_frames", 1) == 1
+        )
+        if passthrough:
+            temp_img_path = input_image
+            img.close()
+            logging.debug("Imagen enviada a Tesseract sin copia temporal")
+        else:
+            if profile["preprocess"]:
+                img = preprocess_image(img)
+            else:
+                img = png_compatible_image(img)
+            temp_img_path = os.path.join(temp_dir, "input.png")
+            # Guardar imagen temporal
+            if image_dpi:
+                img.save(temp_img_path, dpi=image_dpi)
+            else:
+                img.save(temp_img_path)
+        img = None
         
         # ¡¡¡SINTAXIS CORRECTA PARA TESSERACT 5.5.0!!!
-        cmd = [
-            tesseract_cmd,
-            temp_img_path,
-            temp_output_base,  # Base name sin extensión
-            '-l', 'spa+eng',
-            '--oem', '1',
-            '--psm', '3',
-            '-c', 'preserve_interword_spaces=1',
-            '-c', 'tessedit_create_pdf=1'  # ¡¡¡ESTA ES LA FORMA CORRECTA DE GENERAR PDF!!!
-        ]
-        
-        if tessdata_dir:
-            cmd.extend(['--tessdata-dir', tessdata_dir])
+        # Una imagen ya viene rasterizada: el DPI del perfil no aplica
+        image_profile = dict(profile, dpi=int(round(image_dpi[0])) if image_dpi else None)
+        cmd = build_tesseract_cmd(temp_img_path, temp_output_base, image_profile, tessdata_dir)
         
         logging.debug(f"Ejecutando comando imagen CORRECTO v2: {' '.join(cmd)}")
         
-        # Ejecutar Tesseract directamente
-        result = subprocess.run(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=False
-        )
+        # Ejecutar Tesseract directamente (con turno del gobernador)
+        GOVERNOR.acquire()
+        try:
+            result = GOVERNOR.run_tesseract(cmd)
+            if result.returncode != 0:
+                logging.error(f"Error Tesseract imagen: {result.stderr}")
+                # Intentar con configuración más simple
+                simpler_cmd = build_tesseract_cmd(
+                    temp_img_path, temp_output_base, image_profile, tessdata_dir, simple=True
+                )
+                simpler_result = GOVERNOR.run_tesseract(simpler_cmd)
+        finally:
+            GOVERNOR.release()
         
         # Mostrar salida para diagnóstico
         if result.stdout.strip():
@@ -482,28 +1581,6 @@ def ocr_image(input_image: str, output_pdf: str, progress_callback=None):
             logging.debug(f"Tesseract imagen stderr: {result.stderr}")
         
         if result.returncode != 0:
-            logging.error(f"Error Tesseract imagen: {result.stderr}")
-            # Intentar con configuración más simple
-            simpler_cmd = [
-                tesseract_cmd,
-                temp_img_path,
-                temp_output_base,
-                '-l', 'spa+eng',
-                '--oem', '1',
-                '--psm', '3',
-                '-c', 'tessedit_create_pdf=1'
-            ]
-            if tessdata_dir:
-                simpler_cmd.extend(['--tessdata-dir', tessdata_dir])
-            
-            simpler_result = subprocess.run(
-                simpler_cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                check=False
-            )
-            
             if simpler_result.returncode != 0:
                 logging.error(f"Error Tesseract simple imagen: {simpler_result.stderr}")
                 raise Exception("Tesseract falló al procesar la imagen")
@@ -532,14 +1609,6 @@ def ocr_image(input_image: str, output_pdf: str, progress_callback=None):
         with open(output_pdf, "wb") as f:
             f.write(pdf_bytes)
         
-        # Limpiar archivos temporales
-        try:
-            os.unlink(temp_img_path)
-            os.unlink(temp_pdf_path)
-            os.rmdir(temp_dir)
-        except Exception as e:
-            logging.warning(f"No se pudieron limpiar archivos temporales de imagen: {e}")
-        
         file_size = os.path.getsize(output_pdf) / 1024 / 1024
         logging.info(f"Archivo guardado: {output_pdf} ({file_size:.2f} MB)")
         
@@ -548,15 +1617,634 @@ def ocr_image(input_image: str, output_pdf: str, progress_callback=None):
     except Exception as e:
         logging.error(f"Error crítico en ocr_image: {traceback.format_exc()}")
         raise
+    finally:
+        # Limpiar archivos temporales (la imagen original, si se usó directo, queda fuera)
+        if temp_dir is not None:
+            GOVERNOR.untrack_temp_dir(temp_dir)
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+# === PROCESAMIENTO DISTRIBUIDO (COLA COMPARTIDA) ===
+# La cola es una base SQLite en una carpeta compartida por todos los nodos.
+# El coordinador parte el PDF en tareas de una página, los workers las
+# reclaman y guardan el PDF de cada página; si un worker deja de dar
+# señales de vida su tarea vuelve a la cola. El PDF de entrada tiene que
+# estar en una ruta que vean todos los nodos.
+QUEUE_LEASE_SECONDS = 120  # Sin latido durante este tiempo, la tarea se reasigna
+QUEUE_MAX_ATTEMPTS = 3     # Intentos por página antes de darla por fallida
+QUEUE_POLL_SECONDS = 2
+QUEUE_STALL_SECONDS = 300  # Sin avance durante este tiempo, el coordinador procesa las páginas él mismo
+
+QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    input_pdf TEXT NOT NULL,
+    output_pdf TEXT NOT NULL,
+    profile_name TEXT NOT NULL,
+    langs TEXT NOT NULL,
+    lang_source TEXT NOT NULL,
+    total_pages INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    job_id INTEGER NOT NULL,
+    page_no INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    heartbeat REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result BLOB,
+    PRIMARY KEY (job_id, page_no)
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, heartbeat);
+"""
+
+def open_queue(queue_path):
+    """Abre (o crea) la cola compartida"""
+    conn = sqlite3.connect(queue_path, timeout=60, isolation_level=None)
+    conn.executescript(QUEUE_SCHEMA)
+    return conn
+
+def expire_stale_tasks(conn):
+    """Da por fallidas las tareas sin latido que ya agotaron sus intentos"""
+    conn.execute(
+        "UPDATE tasks SET status = 'failed', error = 'Worker sin respuesta' "
+        "WHERE status = 'claimed' AND heartbeat < ? AND attempts >= ?",
+        (time.time() - QUEUE_LEASE_SECONDS, QUEUE_MAX_ATTEMPTS)
+    )
+
+def submit_job(queue_path, input_pdf, output_pdf, profile_name=None):
+    """Encola un PDF como una tarea por página y devuelve el id del trabajo"""
+    profile = get_profile(profile_name)
+    tessdata_dir = resolve_tessdata_dir(profile)
+    input_pdf = os.path.abspath(input_pdf)
+    
+    # El idioma se decide una sola vez para que todos los workers usen lo mismo
+    doc = fitz.open(input_pdf)
+    try:
+        profile, lang_source = choose_document_languages(doc, profile, tessdata_dir)
+        total_pages = len(doc)
+    finally:
+        doc.close()
+    
+    conn = open_queue(queue_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.execute(
+            "INSERT INTO jobs (input_pdf, output_pdf, profile_name, langs, lang_source, total_pages, created) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (input_pdf, os.path.abspath(output_pdf), profile_name or DEFAULT_PROFILE,
+             profile["langs"], lang_source, total_pages, time.time())
+        )
+        job_id = cursor.lastrowid
+        conn.executemany(
+            "INSERT INTO tasks (job_id, page_no) VALUES (?, ?)",
+            [(job_id, n) for n in range(1, total_pages + 1)]
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    
+    logging.info(f"Trabajo {job_id} encolado: {input_pdf} ({total_pages} páginas) en {queue_path}")
+    return job_id
+
+def claim_task(conn, worker_id, job_id=None):
+    """Reclama la próxima página pendiente (o abandonada) para este worker
+
+    Con job_id solo se reclaman páginas de ese trabajo.
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        expire_stale_tasks(conn)
+        row = conn.execute(
+            "SELECT t.job_id, t.page_no, t.attempts, j.input_pdf, j.profile_name, j.langs "
+            "FROM tasks t JOIN jobs j ON j.job_id = t.job_id "
+            "WHERE (t.status = 'pending' OR (t.status = 'claimed' AND t.heartbeat < ?)) "
+            "AND (? IS NULL OR t.job_id = ?) "
+            "ORDER BY t.job_id, t.page_no LIMIT 1",
+            (now - QUEUE_LEASE_SECONDS, job_id, job_id)
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE tasks SET status = 'claimed', worker = ?, heartbeat = ?, attempts = attempts + 1 "
+            "WHERE job_id = ? AND page_no = ?",
+            (worker_id, now, row[0], row[1])
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    
+    job_id, page_no, attempts, input_pdf, profile_name, langs = row
+    return {
+        "job_id": job_id,
+        "page_no": page_no,
+        "attempts": attempts + 1,
+        "input_pdf": input_pdf,
+        "profile_name": profile_name,
+        "langs": langs,
+    }
+
+def _heartbeat_loop(queue_path, task, worker_id, stop_event):
+    """Renueva el latido de la tarea mientras el worker la procesa
+
+    Un error al escribir (p. ej. "database is locked" en la carpeta
+    compartida) solo se registra: el latido sigue con el próximo intento.
+    """
+    conn = None
+    try:
+        while not stop_event.wait(QUEUE_LEASE_SECONDS / 3):
+            try:
+                if conn is None:
+                    conn = open_queue(queue_path)
+                conn.execute(
+                    "UPDATE tasks SET heartbeat = ? WHERE job_id = ? AND page_no = ? AND worker = ? AND status = 'claimed'",
+                    (time.time(), task["job_id"], task["page_no"], worker_id)
+                )
+            except Exception as e:
+                logging.warning(f"Error renovando latido de la tarea {task['job_id']}/{task['page_no']} (se reintenta): {e}")
+    finally:
+        if conn is not None:
+            conn.close()
+
+def finish_task(conn, task, worker_id, pdf_bytes=None, error=None):
+    """Guarda el resultado de una tarea, o la devuelve a la cola si falló"""
+    if error is None:
+        conn.execute(
+            "UPDATE tasks SET status = 'done', result = ?, error = NULL "
+            "WHERE job_id = ? AND page_no = ? AND status != 'done'",
+            (pdf_bytes, task["job_id"], task["page_no"])
+        )
+        return
+    logging.error(f"Worker {worker_id}: error en página {task['page_no']}: {error}")
+    status = 'failed' if task["attempts"] >= QUEUE_MAX_ATTEMPTS else 'pending'
+    conn.execute(
+        "UPDATE tasks SET status = ?, worker = NULL, error = ? "
+        "WHERE job_id = ? AND page_no = ? AND status = 'claimed' AND worker = ?",
+        (status, error, task["job_id"], task["page_no"], worker_id)
+    )
+
+def run_worker(queue_path, worker_id=None, exit_when_idle=False, poll_seconds=QUEUE_POLL_SECONDS, job_id=None):
+    """Procesa páginas de la cola compartida hasta que se lo detenga
+
+    Toma varias tareas a la vez (hasta max_workers de GOVERNOR, cada una
+    con su latido) para usar todos los núcleos del nodo: las páginas se
+    renderizan en este hilo y Tesseract corre en un pool. Con job_id
+    solo procesa páginas de ese trabajo.
+    Devuelve la cantidad de páginas procesadas correctamente.
+    """
+    worker_id = worker_id or f"{platform.node()}-{os.getpid()}"
+    logging.info(f"Worker {worker_id} escuchando la cola {queue_path}")
+    conn = open_queue(queue_path)
+    open_doc = (None, None)
+    dedup_index = new_dedup_index()
+    processed = 0
+    active = []  # (tarea, pendiente de submit_page, evento para cortar el latido)
+    
+    try:
+        with ThreadPoolExecutor(max_workers=GOVERNOR.settings["max_workers"]) as pool:
+            while True:
+                # Tomar tareas mientras haya lugar en este nodo
+                queue_empty = False
+                while len(active) < GOVERNOR.settings["max_workers"] and GOVERNOR.has_capacity():
+                    task = claim_task(conn, worker_id, job_id)
+                    if task is None:
+                        queue_empty = True
+                        break
+                    
+                    n = task["page_no"]
+                    logging.info(f"Worker {worker_id}: trabajo {task['job_id']}, página {n} (intento {task['attempts']})")
+                    stop_event = threading.Event()
+                    threading.Thread(
+                        target=_heartbeat_loop, args=(queue_path, task, worker_id, stop_event), daemon=True
+                    ).start()
+                    try:
+                        # Reusar el documento abierto mientras las páginas sean del mismo PDF
+                        if open_doc[0] != task["input_pdf"]:
+                            if open_doc[1] is not None:
+                                open_doc[1].close()
+                            open_doc = (task["input_pdf"], fitz.open(task["input_pdf"]))
+                        profile = dict(get_profile(task["profile_name"]), langs=task["langs"])
+                        entry = submit_page(
+                            pool, open_doc[1][n - 1], n, profile, resolve_tessdata_dir(profile),
+                            dedup_index, task["input_pdf"]
+                        )
+                        active.append((task, entry, stop_event))
+                    except Exception:
+                        stop_event.set()
+                        finish_task(conn, task, worker_id, error=traceback.format_exc())
+                    finally:
+                        release_page_memory()
+                
+                if not active:
+                    if queue_empty and exit_when_idle:
+                        break
+                    time.sleep(poll_seconds)
+                    continue
+                
+                # Esperar a que termine alguna (o a que pase el intervalo para buscar más)
+                futures = [entry["future"] for _, entry, _ in active if entry["future"] is not None]
+                if len(futures) == len(active):
+                    wait(futures, timeout=poll_seconds, return_when=FIRST_COMPLETED)
+                
+                still_active = []
+                for task, entry, stop_event in active:
+                    if not page_entry_done(entry):
+                        still_active.append((task, entry, stop_event))
+                        continue
+                    stop_event.set()
+                    try:
+                        pdf_bytes = finish_page(entry, dedup_index)
+                    except Exception:
+                        finish_task(conn, task, worker_id, error=traceback.format_exc())
+                        continue
+                    finish_task(conn, task, worker_id, pdf_bytes)
+                    processed += 1
+                active = still_active
+    finally:
+        # Lo que quede sin terminar vuelve a la cola cuando venza el latido
+        for _, _, stop_event in active:
+            stop_event.set()
+        if open_doc[1] is not None:
+            open_doc[1].close()
+        conn.close()
+    
+    logging.info(f"Worker {worker_id} terminó: {processed} páginas procesadas")
+    logging.info(f"Deduplicación del worker:\n{dedup_report(dedup_index)}")
+    return processed
+
+def assemble_job(queue_path, job_id, progress_callback=None, poll_seconds=QUEUE_POLL_SECONDS,
+                 stall_seconds=QUEUE_STALL_SECONDS):
+    """Espera a que terminen las páginas de un trabajo y arma el PDF final
+
+    Si en stall_seconds no termina ninguna página ni late ningún worker
+    (p. ej. porque no hay ninguno conectado), el coordinador procesa él
+    mismo las páginas que queden. Con stall_seconds=None espera siempre.
+    """
+    conn = open_queue(queue_path)
+    writer = None
+    try:
+        job = conn.execute(
+            "SELECT input_pdf, output_pdf, profile_name, langs, lang_source, total_pages FROM jobs WHERE job_id = ?",
+            (job_id,)
+        ).fetchone()
+        if job is None:
+            raise ValueError(f"No existe el trabajo {job_id} en la cola {queue_path}")
+        input_pdf, output_pdf, profile_name, langs, lang_source, total_pages = job
+        profile = dict(get_profile(profile_name), langs=langs)
+        
+        last_activity = None
+        last_progress = time.monotonic()
+        while True:
+            expire_stale_tasks(conn)
+            counts = dict(conn.execute(
+                "SELECT status, COUNT(*) FROM tasks WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+            finished = counts.get('done', 0) + counts.get('failed', 0)
+            if progress_callback and total_pages:
+                progress_callback(finished, total_pages, f"Páginas listas {finished}/{total_pages}")
+            if finished >= total_pages:
+                break
+            
+            # Avance = páginas terminadas o latidos nuevos de algún worker
+            activity = (finished, conn.execute(
+                "SELECT MAX(heartbeat) FROM tasks WHERE job_id = ? AND status = 'claimed'", (job_id,)
+            ).fetchone()[0])
+            if activity != last_activity:
+                last_activity = activity
+                last_progress = time.monotonic()
+            elif stall_seconds is not None and time.monotonic() - last_progress >= stall_seconds:
+                logging.warning(
+                    f"Trabajo {job_id} sin avance en {stall_seconds} s: el coordinador procesa las páginas pendientes"
+                )
+                run_worker(
+                    queue_path, worker_id=f"{platform.node()}-{os.getpid()}-coordinador",
+                    exit_when_idle=True, poll_seconds=poll_seconds, job_id=job_id
+                )
+                last_progress = time.monotonic()
+                continue
+            time.sleep(poll_seconds)
+        
+        # Armar el PDF igual que ocr_pdf: una página por página de entrada y sus huellas
+        doc = fitz.open(input_pdf)
+        writer = OutputPdfWriter(output_pdf)
+        fingerprints = []
+        ocr_pages = 0
+        rows = conn.execute(
+            "SELECT page_no, status, result, error FROM tasks WHERE job_id = ? ORDER BY page_no", (job_id,)
+        )
+        for page_no, status, result, error in rows:
+            if status != 'done':
+                logging.error(f"Error en página {page_no}: {error}")
+                result = None
+            if writer.add_page(doc, page_no, result):
+                ocr_pages += 1
+                fingerprints.append(page_fingerprint(doc, page_no))
+            else:
+                fingerprints.append(None)
+        
+        if ocr_pages == 0:
+            error_msg = "No se pudo procesar ninguna página. Verifica que el PDF tenga contenido visible y que Tesseract esté funcionando correctamente."
+            logging.error(error_msg)
+            writer.discard()
+            doc.close()
+            raise ValueError(error_msg)
+        
+        metadata = writer.doc.metadata or {}
+        metadata["keywords"] = ocr_keywords(profile_name, profile, lang_source)
+        writer.doc.set_metadata(metadata)
+        # Con las huellas, el resultado también sirve para --incremental
+        write_page_manifest(writer.doc, profile_name, profile, lang_source, fingerprints)
+        writer.finish()
+        doc.close()
+        file_size = os.path.getsize(output_pdf) / 1024 / 1024
+        logging.info(f"Archivo guardado: {output_pdf} ({file_size:.2f} MB)")
+        
+        # Los resultados ya están en el PDF: liberar la cola
+        conn.execute("DELETE FROM tasks WHERE job_id = ?", (job_id,))
+        conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+        return True
+    finally:
+        if writer is not None:
+            writer.discard()
+        conn.close()
+
+def ocr_pdf_distributed(input_pdf: str, output_pdf: str, queue_path: str, progress_callback=None, profile_name=None,
+                        stall_seconds=QUEUE_STALL_SECONDS):
+    """Como ocr_pdf, pero repartiendo las páginas entre los workers de la cola"""
+    try:
+        logging.info(f"Iniciando OCR distribuido para PDF: {input_pdf}")
+        job_id = submit_job(queue_path, input_pdf, output_pdf, profile_name)
+        return assemble_job(queue_path, job_id, progress_callback=progress_callback, stall_seconds=stall_seconds)
+    except Exception as e:
+        logging.error(f"Error crítico en ocr_pdf_distributed: {traceback.format_exc()}")
+        raise
+
+# === REPORTE DE PRECISIÓN Y RENDIMIENTO ===
+# Corre un corpus con texto de referencia (archivo.png + archivo.gt.txt o
+# archivo.txt) con varios perfiles y mide errores (CER/WER) contra
+# velocidad y memoria. Sirve para elegir perfil sabiendo cuánto se pierde.
+# En PDFs la referencia puede separar páginas con \f (como pdftotext) y
+# entonces se compara página por página.
+BENCHMARK_MEMORY_POLL_SECONDS = 0.2
+BENCHMARK_DEFAULT_TOLERANCE = 0.01  # Aumento de CER/WER tolerado contra la referencia
+
+def find_ground_truth(corpus_dir):
+    """Lista (archivo, texto de referencia) del corpus"""
+    samples = []
+    for entry in sorted(os.listdir(corpus_dir)):
+        path = os.path.join(corpus_dir, entry)
+        base, ext = os.path.splitext(path)
+        if ext.lower() not in SUPPORTED_EXTENSIONS or not os.path.isfile(path):
+            continue
+        for reference_path in (f"{base}.gt.txt", f"{base}.txt"):
+            if os.path.exists(reference_path):
+                with open(reference_path, encoding="utf-8") as f:
+                    samples.append((path, f.read()))
+                break
+        else:
+            logging.warning(f"Sin texto de referencia para {entry}, se omite")
+    return samples
 
+def normalize_text(text):
+    """Unifica espacios y saltos de línea para comparar solo el contenido"""
+    return " ".join(text.split())
 
+def edit_distance(reference, hypothesis):
+    """Distancia de Levenshtein entre dos secuencias (caracteres o palabras)
+
+    Algoritmo de vectores de bits de Myers/Hyyrö: cada columna de la tabla
+    de distancias se guarda en un entero de Python, así el bucle recorre
+    solo la secuencia más corta y el resto lo hacen operaciones de enteros.
+    """
+    if len(reference) < len(hypothesis):
+        reference, hypothesis = hypothesis, reference
+    length = len(reference)
+    if length == 0:
+        return len(hypothesis)
+    
+    # Máscara de posiciones de cada símbolo en la secuencia larga
+    positions = {}
+    for i, item in enumerate(reference):
+        positions[item] = positions.get(item, 0) | (1 << i)
+    full = (1 << length) - 1
+    last = 1 << (length - 1)
+    plus, minus = full, 0  # Deltas verticales +1 / -1
+    score = length
+    for item in hypothesis:
+        eq = positions.get(item, 0)
+        xv = eq | minus
+        xh = (((eq & plus) + plus) ^ plus) | eq
+        hplus = minus | ~(xh | plus)
+        hminus = plus & xh
+        if hplus & last:
+            score += 1
+        elif hminus & last:
+            score -= 1
+        hplus = (hplus << 1) | 1
+        hminus = hminus << 1
+        plus = (hminus | ~(xv | hplus)) & full
+        minus = hplus & xv & full
+    return score
+
+def extract_pdf_page_texts(pdf_path):
+    """Texto reconocido de cada página de un PDF de salida"""
+    with fitz.open(pdf_path) as doc:
+        return [page.get_text("text") for page in doc]
+
+def score_text(reference, hypothesis):
+    """Errores y totales (caracteres y palabras) de un texto contra su referencia"""
+    reference = normalize_text(reference)
+    hypothesis = normalize_text(hypothesis)
+    return (
+        edit_distance(reference, hypothesis), len(reference),
+        edit_distance(reference.split(), hypothesis.split()), len(reference.split()),
+    )
+
+class MemoryPeakSampler:
+    """Mide cuánta memoria del equipo se consumió como máximo mientras corre un bloque
+
+    Incluye a los procesos de Tesseract; en un equipo con otras cargas el dato
+    es aproximado.
+    """
+    
+    def __enter__(self):
+        self.baseline = available_memory_mb()
+        self.lowest = self.baseline
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+    
+    def _sample(self):
+        while not self.stop_event.wait(BENCHMARK_MEMORY_POLL_SECONDS):
+            free_mb = available_memory_mb()
+            if free_mb is not None and self.lowest is not None:
+                self.lowest = min(self.lowest, free_mb)
+    
+    def __exit__(self, *exc_info):
+        self.stop_event.set()
+        self.thread.join()
+        return False
+    
+    @property
+    def peak_mb(self):
+        if self.baseline is None or self.lowest is None:
+            return None
+        return max(0.0, self.baseline - self.lowest)
+
+def benchmark_profile(samples, profile_name):
+    """Corre el corpus con un perfil y devuelve errores, velocidad y memoria
+
+    El tiempo y la memoria se miden solo durante las llamadas de OCR; la
+    extracción de texto y el cálculo de CER/WER se hacen después.
+    """
+    preload_profile(profile_name)
+    char_errors = char_total = word_errors = word_total = pages = 0
+    failures = []
+    outputs = []
+    elapsed = 0.0
+    with GOVERNOR.temp_dir("ocr_mad_bench_") as temp_dir:
+        with MemoryPeakSampler() as memory:
+            for index, (input_path, reference) in enumerate(samples):
+                output_path = os.path.join(temp_dir, f"{index}_OCR.pdf")
+                start = time.perf_counter()
+                try:
+                    if input_path.lower().endswith(".pdf"):
+                        ocr_pdf(input_path, output_path, profile_name=profile_name)
+                    else:
+                        ocr_image(input_path, output_path, profile_name=profile_name)
+                except Exception as e:
+                    logging.error(f"Benchmark {profile_name}: falló {input_path}: {e}")
+                    failures.append(input_path)
+                    output_path = None
+                elapsed += time.perf_counter() - start
+                outputs.append((input_path, output_path, reference))
+        
+        for input_path, output_path, reference in outputs:
+            page_texts = []
+            if output_path is not None:
+                try:
+                    page_texts = extract_pdf_page_texts(output_path)
+                    pages += len(page_texts)
+                except Exception as e:
+                    logging.error(f"Benchmark {profile_name}: no se pudo leer el resultado de {input_path}: {e}")
+                    failures.append(input_path)
+            # Con una referencia por página (separadas con \f) se compara de a una
+            references = reference.rstrip().split("\f")
+            if len(references) > 1 and len(references) == len(page_texts):
+                pairs = zip(references, page_texts)
+            else:
+                pairs = [(reference, "\n".join(page_texts))]
+            for page_reference, page_hypothesis in pairs:
+                scores = score_text(page_reference, page_hypothesis)
+                char_errors += scores[0]
+                char_total += scores[1]
+                word_errors += scores[2]
+                word_total += scores[3]
+    
+    return {
+        "profile": profile_name,
+        "samples": len(samples),
+        "pages": pages,
+        "failures": failures,
+        "cer": char_errors / char_total if char_total else 0.0,
+        "wer": word_errors / word_total if word_total else 0.0,
+        "seconds": elapsed,
+        "pages_per_sec": pages / elapsed if elapsed > 0 else 0.0,
+        "peak_memory_mb": memory.peak_mb,
+    }
+
+def pareto_front(results):
+    """Perfiles que no tienen otro a la vez más preciso y más rápido"""
+    front = set()
+    for result in results:
+        dominated = any(
+            other["cer"] <= result["cer"] and other["pages_per_sec"] >= result["pages_per_sec"]
+            and (other["cer"] < result["cer"] or other["pages_per_sec"] > result["pages_per_sec"])
+            for other in results
+        )
+        if not dominated:
+            front.add(result["profile"])
+    return front
+
+def compare_with_baseline(results, baseline, tolerance=BENCHMARK_DEFAULT_TOLERANCE):
+    """Lista de regresiones de precisión contra un reporte anterior"""
+    previous = {result["profile"]: result for result in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        old = previous.get(result["profile"])
+        if old is None:
+            continue
+        for metric in ("cer", "wer"):
+            if result[metric] > old[metric] + tolerance:
+                regressions.append(
+                    f"{result['profile']}: {metric.upper()} subió de {old[metric]:.2%} a {result[metric]:.2%}"
+                )
+    return regressions
+
+def format_benchmark_table(results, front):
+    """Tabla de texto con el resultado de cada perfil"""
+    lines = [f"{'Perfil':<10} {'CER':>7} {'WER':>7} {'Pág/s':>7} {'Memoria':>9}  Pareto"]
+    for result in sorted(results, key=lambda r: r["cer"]):
+        memory = f"{result['peak_memory_mb']:.0f} MB" if result["peak_memory_mb"] is not None else "?"
+        lines.append(
+            f"{result['profile']:<10} {result['cer']:>7.2%} {result['wer']:>7.2%} "
+            f"{result['pages_per_sec']:>7.2f} {memory:>9}  {'sí' if result['profile'] in front else ''}"
+        )
+    return "\n".join(lines)
+
+def run_benchmark(corpus_dir, profile_names=None, output_json=None, baseline_json=None,
+                  tolerance=BENCHMARK_DEFAULT_TOLERANCE):
+    """Corre el corpus con cada perfil y devuelve (resultados, frente de Pareto, regresiones)"""
+    samples = find_ground_truth(corpus_dir)
+    if not samples:
+        raise ValueError(f"No hay archivos con texto de referencia en {corpus_dir}")
+    profile_names = profile_names or list(OCR_PROFILES)
+    for name in profile_names:
+        get_profile(name)
+    
+    logging.info(f"Benchmark: {len(samples)} archivos, perfiles {', '.join(profile_names)}")
+    results = [benchmark_profile(samples, name) for name in profile_names]
+    front = pareto_front(results)
+    
+    regressions = []
+    if baseline_json:
+        with open(baseline_json, encoding="utf-8") as f:
+            regressions = compare_with_baseline(results, json.load(f), tolerance)
+    
+    if output_json:
+        report = {
+            "corpus": os.path.abspath(corpus_dir),
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "governor": GOVERNOR.settings,
+            "pareto": sorted(front),
+            "results": results,
+        }
+        with open(output_json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logging.info(f"Reporte de benchmark guardado en {output_json}")
+    
+    return results, front, regressions
+
+def default_output_path(input_path):
+    """Ruta de salida por defecto: mismo nombre con sufijo _OCR.pdf"""
+    base_name = os.path.splitext(input_path)[0]
+    return f"{base_name}_OCR.pdf"
 
 # === INTERFAZ MEJORADA ===
 class OCRApplication:
     def __init__(self, root):
         self.root = root
         self.root.title("OCR-MAD Portable")
-        self.root.geometry("600x400")
+        self.root.geometry("600x490")
         self.root.resizable(False, False)
         self.root.configure(bg='#f0f0f0')
         
@@ -588,6 +2276,29 @@ class OCRApplication:
         self.file_label = ttk.Label(main_frame, text="Ningún archivo seleccionado", wraplength=400)
         self.file_label.grid(row=3, column=0, columnspan=2, pady=5)
         
+        # Selector de perfil de OCR
+        ttk.Label(main_frame, text="Perfil:").grid(row=4, column=0, sticky=tk.E, padx=5)
+        self.profile_names = list(OCR_PROFILES)
+        self.profile_var = tk.StringVar(value=OCR_PROFILES[DEFAULT_PROFILE]["description"])
+        self.profile_combo = ttk.Combobox(
+            main_frame,
+            textvariable=self.profile_var,
+            values=[OCR_PROFILES[name]["description"] for name in self.profile_names],
+            state="readonly",
+            width=45
+        )
+        self.profile_combo.grid(row=4, column=1, sticky=tk.W)
+        self.profile_combo.bind("<<ComboboxSelected>>", lambda e: self.preload_selected_profile())
+        
+        # Reprocesar solo lo nuevo si ya existe el _OCR.pdf
+        self.incremental_var = tk.BooleanVar(value=True)
+        self.incremental_check = ttk.Checkbutton(
+            main_frame,
+            text="Si ya existe el _OCR.pdf, procesar solo páginas nuevas o cambiadas",
+            variable=self.incremental_var
+        )
+        self.incremental_check.grid(row=5, column=0, columnspan=2, pady=5)
+        
         # Barra de progreso
         self.progress = ttk.Progressbar(
             main_frame, 
@@ -595,13 +2306,13 @@ class OCRApplication:
             length=400, 
             mode='determinate'
         )
-        self.progress.grid(row=4, column=0, columnspan=2, pady=15)
+        self.progress.grid(row=6, column=0, columnspan=2, pady=15)
         
         # Label de estado
         self.status_var = tk.StringVar()
         self.status_var.set("Listo para procesar")
         self.status_label = ttk.Label(main_frame, textvariable=self.status_var)
-        self.status_label.grid(row=5, column=0, columnspan=2, pady=5)
+        self.status_label.grid(row=7, column=0, columnspan=2, pady=5)
         
         # Botón de conversión PRINCIPAL
         self.convert_btn = ttk.Button(
@@ -612,7 +2323,7 @@ class OCRApplication:
             width=25,
             style='Accent.TButton'
         )
-        self.convert_btn.grid(row=6, column=0, columnspan=2, pady=15)
+        self.convert_btn.grid(row=8, column=0, columnspan=2, pady=15)
         
         # Botón para ver log
         self.log_btn = ttk.Button(
@@ -621,10 +2332,13 @@ class OCRApplication:
             command=self.show_log,
             width=20
         )
-        self.log_btn.grid(row=7, column=0, columnspan=2, pady=5)
+        self.log_btn.grid(row=9, column=0, columnspan=2, pady=5)
         
         self.selected_file = None
         self.output_file = None
+        self.profile_name = DEFAULT_PROFILE
+        # Páginas ya reconocidas en esta sesión (carátulas, separadores...)
+        self.dedup_index = new_dedup_index()
         
         # Configurar estilos
         style = ttk.Style()
@@ -661,8 +2375,18 @@ class OCRApplication:
         logging.info(" Todas las dependencias verificadas correctamente")
         self.status_var.set(" Listo para procesar archivos")
         self.status_label.config(foreground='#27ae60')
+        self.preload_selected_profile()
         return True
     
+    def selected_profile(self):
+        """Devuelve el nombre del perfil elegido en el combo"""
+        index = self.profile_combo.current()
+        return self.profile_names[index] if index >= 0 else DEFAULT_PROFILE
+    
+    def preload_selected_profile(self):
+        """Precarga en segundo plano los modelos del perfil elegido"""
+        threading.Thread(target=preload_profile, args=(self.selected_profile(),), daemon=True).start()
+    
     def select_file(self):
         """Selecciona un archivo para procesar"""
         file_path = filedialog.askopenfilename(
@@ -680,8 +2404,7 @@ class OCRApplication:
             self.convert_btn.config(state=tk.NORMAL)
             
             # Preparar ruta de salida
-            base_name = os.path.splitext(file_path)[0]
-            self.output_file = f"{base_name}_OCR.pdf"
+            self.output_file = default_output_path(file_path)
             logging.info(f"Archivo seleccionado: {file_path}")
             logging.info(f"Archivo de salida: {self.output_file}")
     
@@ -701,6 +2424,9 @@ class OCRApplication:
         # Deshabilitar botones durante el procesamiento
         self.select_btn.config(state=tk.DISABLED)
         self.convert_btn.config(state=tk.DISABLED)
+        self.profile_combo.config(state=tk.DISABLED)
+        self.incremental_check.config(state=tk.DISABLED)
+        self.profile_name = self.selected_profile()
         self.progress['value'] = 0
         self.status_var.set("Iniciando procesamiento...")
         self.status_label.config(foreground='#2980b9')
@@ -717,17 +2443,21 @@ class OCRApplication:
             
             if self.selected_file.lower().endswith(".pdf"):
                 logging.info("Procesando como PDF")
-                success = ocr_pdf(
+                run_pdf = ocr_pdf_incremental if self.incremental_var.get() else ocr_pdf
+                success = run_pdf(
                     self.selected_file, 
                     self.output_file, 
-                    progress_callback=self.update_progress
+                    progress_callback=self.update_progress,
+                    profile_name=self.profile_name,
+                    dedup_index=self.dedup_index
                 )
             else:
                 logging.info("Procesando como imagen")
                 success = ocr_image(
                     self.selected_file, 
                     self.output_file, 
-                    progress_callback=self.update_progress
+                    progress_callback=self.update_progress,
+                    profile_name=self.profile_name
                 )
             
             if success and os.path.exists(self.output_file):
@@ -774,11 +2504,203 @@ class OCRApplication:
     def reset_ui(self):
         """Restaura la interfaz después de procesar"""
         self.select_btn.config(state=tk.NORMAL)
+        self.profile_combo.config(state="readonly")
+        self.incremental_check.config(state=tk.NORMAL)
         if self.selected_file:
             self.convert_btn.config(state=tk.NORMAL)
         self.progress['value'] = 0
         self.status_label.config(foreground='#27ae60')
 
+# === MODO LÍNEA DE COMANDOS ===
+def parse_args(argv=None):
+    """Argumentos para usar OCR-MAD sin interfaz gráfica"""
+    parser = argparse.ArgumentParser(
+        prog="OCR-MAD",
+        description="OCR para PDF e imágenes. Sin argumentos abre la interfaz gráfica."
+    )
+    parser.add_argument(
+        "inputs", nargs="*", metavar="input",
+        help="PDFs, imágenes o ZIPs a procesar (las páginas repetidas entre ellos se reconocen una vez)"
+    )
+    parser.add_argument("-o", "--output", help="PDF de salida (por defecto <entrada>_OCR.pdf, solo con una entrada)")
+    parser.add_argument(
+        "-p", "--profile",
+        choices=list(OCR_PROFILES),
+        default=DEFAULT_PROFILE,
+        help=f"Perfil de OCR (por defecto {DEFAULT_PROFILE})"
+    )
+    parser.add_argument("--list-profiles", action="store_true", help="Muestra los perfiles disponibles")
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="Si la salida ya existe, reconocer solo las páginas nuevas o cambiadas"
+    )
+    parser.add_argument(
+        "--queue",
+        help="Cola compartida (archivo SQLite). Con un PDF de entrada lo reparte entre los workers"
+    )
+    parser.add_argument("--worker", action="store_true", help="Procesa páginas de la cola indicada con --queue")
+    parser.add_argument("--worker-id", help="Nombre del worker (por defecto equipo-pid)")
+    parser.add_argument("--exit-when-idle", action="store_true", help="El worker termina cuando la cola queda vacía")
+    parser.add_argument(
+        "--stall-seconds", type=int, default=QUEUE_STALL_SECONDS,
+        help=f"Con --queue: si la cola no avanza en estos segundos, esta PC procesa las páginas "
+             f"(0 = esperar siempre; por defecto {QUEUE_STALL_SECONDS})"
+    )
+    
+    bench = parser.add_argument_group("reporte de precisión y rendimiento")
+    bench.add_argument(
+        "--benchmark", metavar="CORPUS",
+        help="Carpeta con imágenes/PDFs y su texto de referencia (.gt.txt o .txt)"
+    )
+    bench.add_argument(
+        "--benchmark-profiles",
+        help="Perfiles a comparar separados por coma (por defecto todos). "
+             "Admite variantes con una clave cambiada, p. ej. balanced,balanced:dpi=200"
+    )
+    bench.add_argument("--benchmark-output", metavar="JSON", help="Guardar el reporte en un JSON")
+    bench.add_argument(
+        "--baseline", metavar="JSON",
+        help="Reporte anterior: sale con error si la precisión empeoró"
+    )
+    bench.add_argument(
+        "--tolerance", type=float, default=BENCHMARK_DEFAULT_TOLERANCE,
+        help=f"Aumento de CER/WER tolerado contra --baseline (por defecto {BENCHMARK_DEFAULT_TOLERANCE})"
+    )
+    
+    limits = parser.add_argument_group("límites de recursos")
+    limits.add_argument(
+        "--max-workers", type=int,
+        help=f"Máximo de Tesseract a la vez (por defecto {GOVERNOR_DEFAULTS['max_workers']})"
+    )
+    limits.add_argument(
+        "--omp-threads", type=int,
+        help=f"Hilos OpenMP por Tesseract (por defecto {GOVERNOR_DEFAULTS['omp_threads']})"
+    )
+    limits.add_argument(
+        "--memory-reserve-mb", type=int,
+        help=f"Memoria libre que se le deja al equipo (por defecto {GOVERNOR_DEFAULTS['memory_reserve_mb']})"
+    )
+    limits.add_argument(
+        "--temp-quota-mb", type=int,
+        help=f"Máximo de disco temporal propio (por defecto {GOVERNOR_DEFAULTS['temp_quota_mb']})"
+    )
+    limits.add_argument("--normal-priority", action="store_true", help="No bajar la prioridad de Tesseract")
+    args = parser.parse_args(argv)
+    if args.worker and not args.queue:
+        parser.error("--worker necesita --queue")
+    if args.benchmark_profiles:
+        args.benchmark_profiles = [name.strip() for name in args.benchmark_profiles.split(",") if name.strip()]
+        for name in args.benchmark_profiles:
+            try:
+                get_profile(name)
+            except ValueError as e:
+                parser.error(str(e))
+    if args.baseline and not args.benchmark:
+        parser.error("--baseline necesita --benchmark")
+    for option in ("max_workers", "omp_threads"):
+        if getattr(args, option) is not None and getattr(args, option) < 1:
+            parser.error(f"--{option.replace('_', '-')} tiene que ser al menos 1")
+    if args.output and (len(args.inputs) > 1 or any(i.lower().endswith(".zip") for i in args.inputs)):
+        parser.error("--output solo se puede usar con un archivo de entrada")
+    return args
+
+def wants_cli(args):
+    """Indica si los argumentos piden el modo línea de comandos"""
+    return bool(args.inputs or args.list_profiles or args.worker or args.benchmark)
+
+def run_cli(args):
+    """Ejecuta OCR-MAD sin interfaz gráfica y devuelve el código de salida"""
+    if args.list_profiles:
+        for name, profile in OCR_PROFILES.items():
+            marker = "*" if name == DEFAULT_PROFILE else " "
+            print(f"{marker} {name:<10} {profile['description']}")
+        return 0
+    
+    success, _, error_msg = setup_tesseract(args.profile)
+    if not success:
+        print(error_msg, file=sys.stderr)
+        return 1
+    preload_profile(args.profile)
+    GOVERNOR.configure(
+        max_workers=args.max_workers,
+        omp_threads=args.omp_threads,
+        memory_reserve_mb=args.memory_reserve_mb,
+        temp_quota_mb=args.temp_quota_mb,
+        low_priority=False if args.normal_priority else None
+    )
+    
+    if args.benchmark:
+        try:
+            results, front, regressions = run_benchmark(
+                args.benchmark, args.benchmark_profiles,
+                output_json=args.benchmark_output,
+                baseline_json=args.baseline,
+                tolerance=args.tolerance
+            )
+        except Exception as e:
+            print(f"ERROR:Error en el benchmark: {e}", file=sys.stderr)
+            return 1
+        print(format_benchmark_table(results, front))
+        for regression in regressions:
+            print(f"REGRESIÓN: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    
+    if args.worker:
+        run_worker(args.queue, worker_id=args.worker_id, exit_when_idle=args.exit_when_idle)
+        return 0
+    
+    def print_progress(current, total, message):
+        print(f"{message} ({current / total * 100:.1f}%)")
+    
+    # Un solo índice para todo el lote: las páginas repetidas entre PDFs también se reutilizan
+    dedup_index = new_dedup_index()
+    
+    def process_one(source, output_file, member_name=None):
+        name = member_name or describe_input(source)
+        try:
+            # La cola necesita una ruta que vean todos los nodos: los miembros de un ZIP se hacen acá
+            if name.lower().endswith(".pdf") and args.queue and member_name is None:
+                ocr_pdf_distributed(
+                    source, output_file, args.queue,
+                    progress_callback=print_progress, profile_name=args.profile,
+                    stall_seconds=args.stall_seconds or None
+                )
+            elif name.lower().endswith(".pdf"):
+                run_pdf = ocr_pdf_incremental if args.incremental else ocr_pdf
+                run_pdf(
+                    source, output_file,
+                    progress_callback=print_progress, profile_name=args.profile, dedup_index=dedup_index
+                )
+            else:
+                ocr_image(source, output_file, progress_callback=print_progress, profile_name=args.profile)
+        except Exception as e:
+            print(f"ERROR:Error durante el procesamiento de {name}: {e}", file=sys.stderr)
+            return False
+        print(f"Archivo generado: {output_file}")
+        return True
+    
+    exit_code = 0
+    processed = 0
+    for input_file in args.inputs:
+        if input_file.lower().endswith(".zip"):
+            # Los ZIP se procesan miembro por miembro sin extraerlos enteros
+            try:
+                for member_name, data in iter_archive_inputs(input_file):
+                    if not process_one(data, archive_output_path(input_file, member_name), member_name):
+                        exit_code = 1
+                    processed += 1
+            except (OSError, zipfile.BadZipFile) as e:
+                print(f"ERROR:No se pudo leer el ZIP {input_file}: {e}", file=sys.stderr)
+                exit_code = 1
+        else:
+            if not process_one(input_file, args.output or default_output_path(input_file)):
+                exit_code = 1
+            processed += 1
+    
+    if processed > 1:
+        print(dedup_report(dedup_index))
+    return exit_code
+
 # === FUNCIÓN PRINCIPAL ===
 def main():
     """Función principal que inicia la aplicación"""
@@ -804,6 +2726,11 @@ def on_closing(root):
         logging.info("=== APLICACIÓN CERRADA ===")
 
 if __name__ == "__main__":
+    # Modo línea de comandos (no necesita ventanas)
+    cli_args = parse_args()
+    if wants_cli(cli_args):
+        sys.exit(run_cli(cli_args))
+    
     # Verificar que se está ejecutando en Windows
     if platform.system() != "Windows":
         root = tk.Tk()
@@ -0,0 +1,54 @@
+"""Medición de errores del reporte de precisión"""
+import random
+import sys
+import time
+from pathlib import Path
+
+import pymupdf as fitz
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import OCR_MAD  # noqa: E402
+
+
+def plain_levenshtein(a, b):
+    previous = list(range(len(b) + 1))
+    for i, x in enumerate(a, start=1):
+        current = [i]
+        for j, y in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (x != y)))
+        previous = current
+    return previous[-1]
+
+
+def test_edit_distance_matches_plain_levenshtein():
+    rng = random.Random(7)
+    for _ in range(300):
+        a = "".join(rng.choice("abcá ") for _ in range(rng.randint(0, 40)))
+        b = "".join(rng.choice("abcá ") for _ in range(rng.randint(0, 40)))
+        assert OCR_MAD.edit_distance(a, b) == plain_levenshtein(a, b)
+        assert OCR_MAD.edit_distance(a.split(), b.split()) == plain_levenshtein(a.split(), b.split())
+
+
+def test_edit_distance_is_fast_on_long_pages():
+    rng = random.Random(3)
+    reference = "".join(rng.choice("abcdefghij ") for _ in range(20000))
+    hypothesis = "".join(c if rng.random() > 0.05 else "x" for c in reference)
+    start = time.perf_counter()
+    assert OCR_MAD.edit_distance(reference, hypothesis) > 0
+    assert time.perf_counter() - start < 2
+
+
+def test_benchmark_scores_pdfs_page_by_page(tmp_path, monkeypatch):
+    input_pdf = tmp_path / "expediente.pdf"
+
+    def fake_ocr_pdf(input_path, output_path, profile_name=None):
+        doc = fitz.open()
+        for text in ("hola mundo", "chau mundo"):
+            doc.new_page().insert_text((72, 72), text)
+        doc.save(output_path)
+
+    monkeypatch.setattr(OCR_MAD, "ocr_pdf", fake_ocr_pdf)
+    monkeypatch.setattr(OCR_MAD, "preload_profile", lambda name=None: set())
+    result = OCR_MAD.benchmark_profile([(str(input_pdf), "hola mundo\fchau mundo\f")], "fast")
+    assert result["pages"] == 2
+    assert result["cer"] == 0.0 and result["wer"] == 0.0
@@ -0,0 +1,32 @@
+"""Hashes de página para la deduplicación"""
+import hashlib
+import sys
+from pathlib import Path
+
+import pymupdf as fitz
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import OCR_MAD  # noqa: E402
+
+
+def test_render_digest_matches_pixels():
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "expediente")
+    img, digest = OCR_MAD.render_page_image(page, 100, with_digest=True)
+    assert digest == hashlib.sha256(f"{img.mode}{img.size}".encode() + img.tobytes()).hexdigest()
+    assert OCR_MAD.page_hashes(img, digest) == OCR_MAD.page_hashes(img)
+
+
+def test_exact_copy_is_reused():
+    doc = fitz.open()
+    for _ in range(2):
+        doc.new_page().insert_text((72, 72), "expediente")
+    index = OCR_MAD.new_dedup_index()
+    profile = OCR_MAD.get_profile("fast")
+    first = OCR_MAD.prepare_page(doc[0], 1, profile, index, "a.pdf")
+    OCR_MAD.dedup_store(index, first[1], b"%PDF", "a.pdf", 1)
+    _, key, reuse, original = OCR_MAD.prepare_page(doc[1], 2, profile, index, "a.pdf")
+    assert key == first[1]
+    assert reuse == b"%PDF"
+    assert original == ("a.pdf", 1)
@@ -0,0 +1,54 @@
+"""Cupo de disco temporal del gobernador de recursos"""
+import os
+import sys
+import zipfile
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import OCR_MAD  # noqa: E402
+
+
+@pytest.fixture
+def tracked_dirs(monkeypatch):
+    """Anota cada carpeta temporal que se registra en el gobernador"""
+    seen = []
+    track = OCR_MAD.GOVERNOR.track_temp_dir
+
+    def record(temp_dir):
+        seen.append(temp_dir)
+        track(temp_dir)
+
+    monkeypatch.setattr(OCR_MAD.GOVERNOR, "track_temp_dir", record)
+    return seen
+
+
+def test_failed_page_temp_dir_is_removed(monkeypatch, tracked_dirs):
+    def broken_tesseract(cmd, **kwargs):
+        raise RuntimeError("Tesseract no arrancó")
+
+    monkeypatch.setattr(OCR_MAD.GOVERNOR, "run_tesseract", broken_tesseract)
+    img = Image.new("L", (50, 50), 255)
+    with pytest.raises(RuntimeError):
+        OCR_MAD.ocr_page_image_pdf(img, 1, OCR_MAD.get_profile("fast"))
+
+    assert len(tracked_dirs) == 1
+    assert not os.path.exists(tracked_dirs[0])
+    assert tracked_dirs[0] not in OCR_MAD.GOVERNOR.temp_dirs
+
+
+def test_zip_spill_counts_toward_temp_quota(tmp_path, monkeypatch, tracked_dirs):
+    monkeypatch.setattr(OCR_MAD, "ARCHIVE_MEMORY_MAX_MB", 0)
+    zip_path = tmp_path / "lote.zip"
+    with zipfile.ZipFile(zip_path, "w") as archive:
+        archive.writestr("grande.pdf", b"%" * (2 * 1024 * 1024))
+
+    for name, source in OCR_MAD.iter_archive_inputs(str(zip_path)):
+        assert name == "grande.pdf"
+        assert os.path.dirname(source) in OCR_MAD.GOVERNOR.temp_dirs
+        assert OCR_MAD.GOVERNOR.temp_usage_mb() >= 2
+
+    assert tracked_dirs and not any(os.path.exists(d) for d in tracked_dirs)
+    assert OCR_MAD.GOVERNOR.temp_usage_mb() == 0
@@ -0,0 +1,91 @@
+"""Huellas de página y reprocesamiento incremental (sin Tesseract)"""
+import sys
+from pathlib import Path
+
+import pymupdf as fitz
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import OCR_MAD  # noqa: E402
+
+
+def source_doc(*texts):
+    """PDF con una página por texto"""
+    doc = fitz.open()
+    for text in texts:
+        page = doc.new_page()
+        page.insert_text((72, 72), text)
+    return doc
+
+
+def form_wrapped_doc(source, page_numbers):
+    """PDF cuyas páginas son Form XObjects de otras (como al unir o imponer)"""
+    doc = fitz.open()
+    for n in page_numbers:
+        page = doc.new_page()
+        page.show_pdf_page(page.rect, source, n)
+    return doc
+
+
+def fingerprints(doc):
+    return [OCR_MAD.page_fingerprint(doc, n) for n in range(1, len(doc) + 1)]
+
+
+def test_form_wrapped_pages_from_different_sources_differ():
+    source = source_doc("primera", "segunda")
+    doc = form_wrapped_doc(source, [0, 1])
+    assert doc[0].read_contents() == doc[1].read_contents()
+    first, second = fingerprints(doc)
+    assert first != second
+
+
+def test_annotation_changes_fingerprint():
+    doc = source_doc("expediente")
+    before = OCR_MAD.page_fingerprint(doc, 1)
+    doc[0].add_freetext_annot(fitz.Rect(100, 100, 300, 150), "RECIBIDO")
+    assert OCR_MAD.page_fingerprint(doc, 1) != before
+
+
+def test_fingerprint_survives_object_renumbering(tmp_path):
+    source = source_doc("primera", "segunda")
+    doc = form_wrapped_doc(source, [0, 1])
+    doc[1].add_freetext_annot(fitz.Rect(100, 100, 300, 150), "RECIBIDO")
+    before = fingerprints(doc)
+    path = tmp_path / "renumerado.pdf"
+    doc.save(path, garbage=4)
+    assert fingerprints(fitz.open(path)) == before
+
+
+@pytest.fixture
+def fake_ocr(monkeypatch):
+    """Reemplaza Tesseract por páginas de texto y anota qué páginas se reconocieron"""
+    recognized = []
+
+    def ocr_document_pages(doc, page_numbers, profile, tessdata_dir="", dedup_index=None,
+                           source="", progress_callback=None):
+        for n in page_numbers:
+            recognized.append(n)
+            yield n, source_doc(f"OCR {n}").tobytes()
+
+    monkeypatch.setattr(OCR_MAD, "ocr_document_pages", ocr_document_pages)
+    monkeypatch.setattr(OCR_MAD, "choose_document_languages", lambda doc, profile, tessdata_dir="": (profile, "perfil"))
+    return recognized
+
+
+def test_incremental_reocrs_replaced_form_wrapped_page(tmp_path, fake_ocr):
+    source = source_doc("uno", "dos", "tres")
+    input_pdf = str(tmp_path / "expediente.pdf")
+    output_pdf = str(tmp_path / "expediente_OCR.pdf")
+    form_wrapped_doc(source, [0, 1]).save(input_pdf)
+    OCR_MAD.ocr_pdf(input_pdf, output_pdf, profile_name="fast")
+    assert fake_ocr == [1, 2]
+
+    # Misma estructura (q /fzFrm0 Do Q), pero la página 2 ahora muestra otra fuente
+    form_wrapped_doc(source, [0, 2]).save(input_pdf)
+    fake_ocr.clear()
+    OCR_MAD.ocr_pdf_incremental(input_pdf, output_pdf, profile_name="fast")
+    assert fake_ocr == [2]
+
+    fake_ocr.clear()
+    OCR_MAD.ocr_pdf_incremental(input_pdf, output_pdf, profile_name="fast")
+    assert fake_ocr == []
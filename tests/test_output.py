@@ -0,0 +1,72 @@
+"""Escritura por tramos del PDF de salida y preprocesamiento (sin Tesseract)"""
+import os
+import random
+import sys
+from pathlib import Path
+
+import pymupdf as fitz
+import pytest
+from PIL import Image, ImageEnhance, ImageFilter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import OCR_MAD  # noqa: E402
+
+
+def text_pdf(*texts):
+    doc = fitz.open()
+    for text in texts:
+        page = doc.new_page()
+        page.insert_text((72, 72), text)
+    return doc
+
+
+@pytest.fixture
+def fake_ocr(monkeypatch):
+    """Reemplaza Tesseract por páginas de texto; la página 3 falla"""
+    def ocr_document_pages(doc, page_numbers, profile, tessdata_dir="", dedup_index=None,
+                           source="", progress_callback=None):
+        for n in page_numbers:
+            yield n, None if n == 3 else text_pdf(f"OCR {n}").tobytes()
+
+    monkeypatch.setattr(OCR_MAD, "ocr_document_pages", ocr_document_pages)
+    monkeypatch.setattr(OCR_MAD, "choose_document_languages", lambda doc, profile, tessdata_dir="": (profile, "perfil"))
+    monkeypatch.setattr(OCR_MAD, "OUTPUT_FLUSH_PAGES", 2)
+
+
+def test_output_written_in_chunks_keeps_pages_and_manifest(tmp_path, fake_ocr):
+    input_pdf = str(tmp_path / "expediente.pdf")
+    output_pdf = str(tmp_path / "expediente_OCR.pdf")
+    text_pdf("uno", "dos", "tres", "cuatro", "cinco").save(input_pdf)
+
+    OCR_MAD.ocr_pdf(input_pdf, output_pdf, profile_name="fast")
+
+    assert not os.path.exists(output_pdf + ".tmp")
+    with fitz.open(output_pdf) as doc:
+        texts = [page.get_text().strip() for page in doc]
+        manifest = OCR_MAD.read_page_manifest(doc)
+    assert texts == ["OCR 1", "OCR 2", "tres", "OCR 4", "OCR 5"]
+    assert [fp is None for fp in manifest["pages"]] == [False, False, True, False, False]
+
+
+def test_no_recognized_page_keeps_previous_output(tmp_path, monkeypatch, fake_ocr):
+    monkeypatch.setattr(
+        OCR_MAD, "ocr_document_pages",
+        lambda doc, page_numbers, *args, **kwargs: ((n, None) for n in page_numbers)
+    )
+    input_pdf = str(tmp_path / "expediente.pdf")
+    output_pdf = tmp_path / "expediente_OCR.pdf"
+    text_pdf("uno", "dos", "tres").save(input_pdf)
+    output_pdf.write_bytes(b"anterior")
+
+    with pytest.raises(ValueError):
+        OCR_MAD.ocr_pdf(input_pdf, str(output_pdf), profile_name="fast")
+    assert output_pdf.read_bytes() == b"anterior"
+    assert not os.path.exists(str(output_pdf) + ".tmp")
+
+
+def test_preprocess_matches_enhance_chain():
+    rng = random.Random(7)
+    img = Image.frombytes("RGB", (64, 48), bytes(rng.randrange(256) for _ in range(64 * 48 * 3)))
+    expected = ImageEnhance.Contrast(img.convert("L")).enhance(2.0)
+    expected = expected.filter(ImageFilter.SHARPEN).point(lambda x: 0 if x < 140 else 255, "1")
+    assert OCR_MAD.preprocess_image(img).tobytes() == expected.tobytes()
@@ -0,0 +1,58 @@
+"""Cola distribuida: latidos y coordinador sin workers (sin Tesseract)"""
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+
+import pymupdf as fitz
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import OCR_MAD  # noqa: E402
+
+
+def text_pdf(*texts):
+    doc = fitz.open()
+    for text in texts:
+        page = doc.new_page()
+        page.insert_text((72, 72), text)
+    return doc
+
+
+def test_heartbeat_survives_locked_database(monkeypatch):
+    beats = []
+    stop_event = threading.Event()
+
+    class FlakyConnection:
+        def execute(self, sql, params):
+            beats.append(params)
+            if len(beats) == 1:
+                raise sqlite3.OperationalError("database is locked")
+            if len(beats) == 3:
+                stop_event.set()
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(OCR_MAD, "QUEUE_LEASE_SECONDS", 0.03)
+    monkeypatch.setattr(OCR_MAD, "open_queue", lambda queue_path: FlakyConnection())
+    task = {"job_id": 1, "page_no": 1}
+    OCR_MAD._heartbeat_loop("cola.db", task, "pc-1", stop_event)
+    assert len(beats) == 3
+
+
+def test_coordinator_processes_pages_when_no_worker_attaches(tmp_path, monkeypatch):
+    monkeypatch.setattr(OCR_MAD, "choose_document_languages", lambda doc, profile, tessdata_dir="": (profile, "perfil"))
+    monkeypatch.setattr(
+        OCR_MAD, "ocr_page_image_pdf",
+        lambda img, n, profile, tessdata_dir="": text_pdf(f"OCR {n}").tobytes()
+    )
+    input_pdf = str(tmp_path / "expediente.pdf")
+    output_pdf = str(tmp_path / "expediente_OCR.pdf")
+    queue_path = str(tmp_path / "cola.db")
+    text_pdf("uno", "dos", "tres").save(input_pdf)
+
+    job_id = OCR_MAD.submit_job(queue_path, input_pdf, output_pdf, "fast")
+    OCR_MAD.assemble_job(queue_path, job_id, poll_seconds=0.01, stall_seconds=0.05)
+
+    with fitz.open(output_pdf) as doc:
+        assert [page.get_text().strip() for page in doc] == ["OCR 1", "OCR 2", "OCR 3"]